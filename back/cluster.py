@@ -0,0 +1,367 @@
+"""
+Chunk sharding across several backend instances.
+
+A backend becomes a coordinator when it is started with WHISPER_APP_PEERS
+(comma-separated base URLs). The list is fixed for the process: peers receive
+the speech audio of every long-file job, so it cannot be changed over HTTP.
+Peers are ordinary backends; extra local processes on other ports work for
+testing.
+
+For long files, _do_full_transcription hands its chunks (already decoded and
+VAD-trimmed by pipeline.ChunkPipeline) to a ShardScheduler:
+  • every peer plus the local model is a worker that takes one chunk at a time,
+    so a faster node simply takes more chunks;
+  • a peer receives only the chunk's speech audio as 16-bit PCM on
+    POST /shard/transcribe and answers with segments relative to that audio;
+  • a failed or timed-out request puts the chunk back at the front of the
+    queue and benches the peer for a growing cooldown; after MAX_REMOTE_ATTEMPTS
+    remote failures a chunk is only given to the local model;
+  • when the chunk everyone is waiting on runs much longer than expected and a
+    worker is idle, it is handed out a second time and the first answer wins;
+  • results are passed back in chunk order, so the SSE stream looks exactly
+    like a single-node job.
+"""
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+
+import numpy as np
+
+MAX_REMOTE_ATTEMPTS = 3        # remote failures before a chunk is pinned to the local model
+TIMEOUT_MIN = 60.0             # seconds per peer request, plus…
+TIMEOUT_PER_AUDIO_S = 3.0      # …this much per second of speech sent
+COOLDOWN_BASE = 5.0            # first cooldown after a peer failure (doubles each time)
+COOLDOWN_MAX = 300.0
+SLOW_FACTOR = 2.0              # re-dispatch when a chunk runs this many times its expected time…
+SLOW_MIN = 30.0                # …and at least this long
+_EWMA = 0.3                    # smoothing for seconds-per-audio-second
+
+
+# ─── Peers ───────────────────────────────────────────────────────────────────
+
+class PeerError(Exception):
+    """A peer could not transcribe a chunk (network error, HTTP error, bad reply)."""
+
+
+class Peer:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.failures = 0          # consecutive
+        self.cooldown_until = 0.0  # time.monotonic()
+        self.last_error: str | None = None
+        self.chunks = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def mark_failed(self, error: str) -> None:
+        self.failures += 1
+        self.last_error = error
+        self.cooldown_until = time.monotonic() + min(COOLDOWN_MAX, COOLDOWN_BASE * 2 ** (self.failures - 1))
+
+    def transcribe(
+        self,
+        audio: np.ndarray,
+        model_name: str,
+        language: str | None,
+        sampling_rate: int,
+    ) -> tuple[str, list[tuple[float, float, str]]]:
+        """Send float32 speech audio to the peer; returns (language, [(start, end, text), …])."""
+        query = {"model": model_name, "sample_rate": sampling_rate}
+        if language:
+            query["language"] = language
+        body = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        request = urllib.request.Request(
+            f"{self.url}/shard/transcribe?{urllib.parse.urlencode(query)}",
+            data=body,
+            headers={"Content-Type": "application/octet-stream"},
+            method="POST",
+        )
+        seconds = audio.size / sampling_rate
+        t0 = time.monotonic()
+        try:
+            with urllib.request.urlopen(request, timeout=TIMEOUT_MIN + TIMEOUT_PER_AUDIO_S * seconds) as resp:
+                reply = json.load(resp)
+            segments = [(float(s), float(e), str(t)) for s, e, t in reply["segments"]]
+            detected = reply.get("language") or language or "unknown"
+        except urllib.error.HTTPError as e:
+            try:
+                detail = json.load(e).get("detail", "")
+            except Exception:
+                detail = ""
+            raise PeerError(f"{self.url}: HTTP {e.code} {detail}".rstrip()) from e
+        except (OSError, http.client.HTTPException, ValueError, KeyError, TypeError) as e:
+            # HTTPException covers a peer dying mid-response (IncompleteRead, BadStatusLine)
+            raise PeerError(f"{self.url}: {e}") from e
+
+        self.failures = 0
+        self.chunks += 1
+        self.audio_seconds += seconds
+        self.busy_seconds += time.monotonic() - t0
+        return detected, segments
+
+    def info(self) -> dict:
+        return {
+            "url": self.url,
+            "available": self.available(),
+            "consecutive_failures": self.failures,
+            "cooldown_s": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+            "last_error": self.last_error,
+            "chunks": self.chunks,
+            "audio_seconds": round(self.audio_seconds, 1),
+            "busy_seconds": round(self.busy_seconds, 1),
+        }
+
+
+_peers: list[Peer] = []
+_peers_lock = threading.Lock()
+
+
+def get_peers() -> list[Peer]:
+    with _peers_lock:
+        return list(_peers)
+
+
+def set_peers(urls: list[str]) -> list[Peer]:
+    """Replace the peer list, keeping the state of peers that stay."""
+    global _peers
+    with _peers_lock:
+        known = {p.url: p for p in _peers}
+        _peers = []
+        for url in urls:
+            url = url.strip().rstrip("/")
+            if url and all(p.url != url for p in _peers):
+                _peers.append(known.get(url) or Peer(url))
+        return list(_peers)
+
+
+set_peers(os.environ.get("WHISPER_APP_PEERS", "").split(","))
+
+
+# ─── Scheduling ──────────────────────────────────────────────────────────────
+
+class LocalWorker:
+    """
+    The coordinator's own model. fn(audio, language, should_stop) -> (language,
+    segments); it should return early once should_stop() is true — the chunk
+    was won by a peer or the run is over — so the model is freed promptly.
+    """
+    name = "local"
+    peer = None
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def run(self, audio: np.ndarray, language: str | None, should_stop):
+        return self.fn(audio, language, should_stop)
+
+
+class PeerWorker:
+    def __init__(self, peer: Peer, model_name: str, sampling_rate: int):
+        self.name = peer.url
+        self.peer = peer
+        self.model_name = model_name
+        self.sampling_rate = sampling_rate
+
+    def run(self, audio: np.ndarray, language: str | None, should_stop):
+        return self.peer.transcribe(audio, self.model_name, language, self.sampling_rate)
+
+
+class ShardTask:
+    """One chunk. `audio` is None for chunks without speech; `meta` is passed back untouched."""
+
+    def __init__(self, seq: int, audio: np.ndarray | None, audio_seconds: float, meta: dict):
+        self.seq = seq
+        self.audio = audio
+        self.audio_seconds = audio_seconds
+        self.meta = meta
+        self.running: set[str] = set()
+        self.started: float | None = None
+        self.remote_failures = 0
+        self.speculated = False
+        self.result: tuple[str, list] | None = None
+        self.winner: str | None = None
+
+
+class ShardScheduler:
+    def __init__(self, workers: list, language: str | None):
+        self.workers = workers
+        self.language = language
+        self.lookahead = len(workers) + 1     # chunks held in memory beyond the one being merged
+        self._cond = threading.Condition()
+        self._pending: deque[ShardTask] = deque()
+        self._tasks: dict[int, ShardTask] = {}
+        self._stopping = False
+        self._fatal: BaseException | None = None
+        self._sec_per_audio_s: float | None = None
+        self._stats = {w.name: {"chunks": 0, "failures": 0, "speculative_wins": 0, "seconds": 0.0} for w in workers}
+        self._retries = 0
+        self._speculations = 0
+
+    def run(self, tasks, on_result, is_cancelled) -> bool:
+        """
+        Dispatch `tasks` (an iterator of ShardTask, seq 0, 1, 2, …) and call
+        on_result(task, language, segments) in seq order on this thread.
+        Returns False if is_cancelled() stopped the run early.
+        """
+        threads = [
+            threading.Thread(target=self._work, args=(w,), daemon=True, name=f"shard-{w.name}")
+            for w in self.workers
+        ]
+        for t in threads:
+            t.start()
+
+        tasks = iter(tasks)
+        exhausted = False
+        total = 0
+        next_seq = 0
+        try:
+            while True:
+                if is_cancelled():
+                    return False
+
+                if not exhausted and total - next_seq < self.lookahead:
+                    task = next(tasks, None)   # may block on decode/VAD; the lock is not held
+                    with self._cond:
+                        if task is None:
+                            exhausted = True
+                        else:
+                            self._tasks[task.seq] = task
+                            total += 1
+                            if task.audio is not None:
+                                self._pending.append(task)
+                                self._cond.notify_all()
+                            else:
+                                task.result = (self.language, [])
+
+                ready: list[ShardTask] = []
+                with self._cond:
+                    if self._fatal is not None:
+                        raise self._fatal
+                    while next_seq in self._tasks and self._tasks[next_seq].result is not None:
+                        ready.append(self._tasks.pop(next_seq))
+                        next_seq += 1
+                    if not ready:
+                        if exhausted and next_seq == total:
+                            return True
+                        self._maybe_speculate(next_seq)
+                        if exhausted or total - next_seq >= self.lookahead:
+                            self._cond.wait(0.25)
+
+                for task in ready:
+                    detected, segments = task.result
+                    on_result(task, detected, segments)
+        finally:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            # The local model must be free before the job ends; peers are only waiting on HTTP
+            for worker, t in zip(self.workers, threads):
+                if worker.peer is None:
+                    t.join()
+
+    def _maybe_speculate(self, head_seq: int) -> None:
+        # Caller holds the lock.
+        head = self._tasks.get(head_seq)
+        if head is None or head.result is not None or not head.running or head.speculated or self._pending:
+            return
+        expected = (self._sec_per_audio_s or 0.0) * head.audio_seconds
+        if self._sec_per_audio_s is None or time.monotonic() - head.started < max(SLOW_MIN, SLOW_FACTOR * expected):
+            return
+        head.speculated = True
+        self._speculations += 1
+        self._pending.appendleft(head)
+        self._cond.notify_all()
+
+    def _take(self, worker) -> ShardTask | None:
+        # Caller holds the lock. Blocks until there is a task this worker may run.
+        while not self._stopping:
+            if worker.peer is not None and not worker.peer.available():
+                self._cond.wait(max(0.05, worker.peer.cooldown_until - time.monotonic()))
+                continue
+            for task in self._pending:
+                if task.result is not None or worker.name in task.running:
+                    continue
+                if worker.peer is not None and task.remote_failures >= MAX_REMOTE_ATTEMPTS:
+                    continue
+                self._pending.remove(task)
+                task.running.add(worker.name)
+                if task.started is None:
+                    task.started = time.monotonic()
+                return task
+            # Drop finished duplicates so they don't pile up
+            self._pending = deque(t for t in self._pending if t.result is None)
+            self._cond.wait()
+        return None
+
+    def _work(self, worker) -> None:
+        while True:
+            with self._cond:
+                task = self._take(worker)
+            if task is None:
+                return
+            t0 = time.monotonic()
+            try:
+                result = worker.run(
+                    task.audio, self.language, lambda: self._stopping or task.result is not None,
+                )
+            except PeerError as e:
+                worker.peer.mark_failed(str(e))
+                try:
+                    print(f"[cluster] chunk {task.seq} failed on {worker.name}: {e}", flush=True)
+                except (BrokenPipeError, OSError):
+                    pass
+                with self._cond:
+                    self._stats[worker.name]["failures"] += 1
+                    task.running.discard(worker.name)
+                    task.remote_failures += 1
+                    if task.result is None and not task.running and task not in self._pending:
+                        self._retries += 1
+                        self._pending.appendleft(task)
+                    self._cond.notify_all()
+                continue
+            except BaseException as e:
+                with self._cond:
+                    task.running.discard(worker.name)
+                    if self._fatal is None:
+                        self._fatal = e
+                    self._cond.notify_all()
+                return
+
+            elapsed = time.monotonic() - t0
+            with self._cond:
+                task.running.discard(worker.name)
+                stats = self._stats[worker.name]
+                stats["seconds"] += elapsed
+                if task.result is None:
+                    task.result = result
+                    task.winner = worker.name
+                    stats["chunks"] += 1
+                    if task.speculated:
+                        stats["speculative_wins"] += 1
+                    if task.audio_seconds > 0:
+                        rate = elapsed / task.audio_seconds
+                        if self._sec_per_audio_s is None:
+                            self._sec_per_audio_s = rate
+                        else:
+                            self._sec_per_audio_s += _EWMA * (rate - self._sec_per_audio_s)
+                    task.audio = None  # free the PCM once a result is in
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": {
+                    name: {**s, "seconds": round(s["seconds"], 2)} for name, s in self._stats.items()
+                },
+                "retries": self._retries,
+                "speculative_dispatches": self._speculations,
+            }
@@ -0,0 +1,92 @@
+"""
+Negotiable framing for result streams (SSE job streams and /ws/realtime).
+
+The default everywhere is still one JSON object per event. Clients can opt in to:
+  • coalescing — consecutive "segment" events are grouped into one
+    {"type": "batch", "events": [...]} frame, flushed when it reaches a size
+    budget, when it has waited long enough, or before any other event;
+  • MessagePack — binary websocket frames instead of JSON text (needs the
+    optional `msgpack` package; falls back to JSON if it is missing);
+  • compression — gzip for SSE, sync-flushed after every frame so the client
+    can still decode incrementally. Websockets get permessage-deflate from
+    uvicorn when the client offers it.
+"""
+import importlib.util
+import json
+import time
+import zlib
+
+COALESCE_MAX_EVENTS = 64        # default size budget when coalescing is on
+COALESCE_MAX_DELAY = 0.05       # default time budget (seconds)
+
+
+class SegmentCoalescer:
+    """Groups consecutive segment events into batch frames."""
+
+    def __init__(self, max_events: int = COALESCE_MAX_EVENTS, max_delay: float = COALESCE_MAX_DELAY):
+        self.max_events = max(1, max_events)
+        self.max_delay = max(0.0, max_delay)
+        self._pending: list[dict] = []
+        self._since = 0.0
+
+    def add(self, event: dict) -> list[dict]:
+        """Queue an event; return the frames that are ready to send, in order."""
+        if event.get("type") != "segment":
+            return self.flush() + [event]
+        if not self._pending:
+            self._since = time.monotonic()
+        self._pending.append(event)
+        if len(self._pending) >= self.max_events:
+            return self.flush()
+        return []
+
+    def due(self) -> list[dict]:
+        """Frames whose time budget has run out."""
+        if self._pending and time.monotonic() - self._since >= self.max_delay:
+            return self.flush()
+        return []
+
+    def time_left(self) -> float | None:
+        if not self._pending:
+            return None
+        return max(0.0, self.max_delay - (time.monotonic() - self._since))
+
+    def flush(self) -> list[dict]:
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, []
+        if len(pending) == 1:
+            return pending
+        return [{"type": "batch", "events": pending}]
+
+
+def msgpack_available() -> bool:
+    return importlib.util.find_spec("msgpack") is not None
+
+
+class WebSocketEncoder:
+    """Send frames over a Starlette WebSocket as JSON text or MessagePack binary."""
+
+    def __init__(self, encoding: str = "json"):
+        self.encoding = "msgpack" if encoding == "msgpack" and msgpack_available() else "json"
+        if self.encoding == "msgpack":
+            import msgpack
+            self._packb = msgpack.packb
+
+    async def send(self, websocket, frame: dict) -> None:
+        if self.encoding == "msgpack":
+            await websocket.send_bytes(self._packb(frame, use_bin_type=True))
+        else:
+            await websocket.send_json(frame)
+
+
+async def gzip_stream(chunks):
+    """Gzip an async iterator of str chunks, sync-flushing after each one."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 → gzip container
+    async for chunk in chunks:
+        yield compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush(zlib.Z_FINISH)
+
+
+def sse_frame(frame: dict) -> str:
+    return f"data: {json.dumps(frame)}\n\n"
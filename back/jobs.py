@@ -0,0 +1,352 @@
+"""
+Bounded registry for background jobs and their SSE event logs.
+
+Replaces the old module-level `_jobs` / `_job_done` / `_cancelled_jobs`
+containers, which grew forever when a stream was never opened or abandoned.
+
+  • Finished jobs are dropped FINISHED_TTL seconds after their last activity,
+    and any job idle for IDLE_TTL is dropped regardless of state.
+  • Each job keeps at most MAX_EVENTS_IN_MEMORY events in memory; older ones
+    spill to a JSON-lines file under <data dir>/jobs/<pid>-<start time> and are
+    read back on demand. Each process owns its own directory, so several
+    backends sharing a data dir never touch each other's spill files; the
+    directories of processes that are gone are removed at startup.
+  • When the estimated in-memory size of all jobs exceeds MAX_MEMORY_BYTES the
+    biggest jobs are spilled until the total is back under the ceiling.
+  • Event hooks (the transcript writer) and spill-file writes run outside the
+    registry lock, which the SSE generators take on the event loop. A job's
+    on_close runs on the worker when it finishes, even if the job was removed
+    meanwhile, so buffered hook state is never lost.
+  • Cancellation is a flag on the job. A job that is no longer registered
+    (deleted by an admin or expired) also counts as cancelled, so its worker
+    stops instead of running to the end with nowhere to write.
+  • A background sweeper collects expired jobs every COLLECT_INTERVAL, so
+    memory is released even when no new job comes in.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from array import array
+
+import transcriber
+
+FINISHED_TTL = 10 * 60          # seconds a finished job waits for its stream
+IDLE_TTL = 6 * 60 * 60          # seconds without any append/read before a job is dropped
+MAX_EVENTS_IN_MEMORY = 2000     # per job; older events spill to disk
+MAX_MEMORY_BYTES = 64 * 1024 * 1024
+COLLECT_INTERVAL = 30.0         # seconds between collections (sweeper and opportunistic)
+
+
+def _process_tag(pid: int) -> str | None:
+    """"<pid>-<start time>" of a live process (None if it is gone), so a reused pid doesn't match."""
+    import psutil
+    try:
+        return f"{pid}-{int(psutil.Process(pid).create_time())}"
+    except psutil.NoSuchProcess:
+        return None
+
+
+def _estimate_size(event: dict) -> int:
+    """Cheap approximation of an event's memory footprint."""
+    return 64 * len(event) + sum(len(v) for v in event.values() if isinstance(v, str))
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, spill_dir: str, on_event=None, on_close=None):
+        self.id = job_id
+        self.kind = kind
+        self.on_event = on_event  # optional callable(event), e.g. a transcript writer
+        self.on_close = on_close  # optional callable(), run by the worker when it is done
+        self.created = time.time()
+        self.touched = self.created
+        self.done = False
+        self.cancelled = False
+        self.removed = False
+        self.status = "running"
+        self._spill_path = os.path.join(spill_dir, f"{job_id}.jsonl")
+        self._spill_lock = threading.Lock()  # serialises spill writes; taken before the registry lock
+        self._spill_offsets = array("q")  # byte offset of every spilled event
+        self._spill_end = 0
+        self._events: list[dict] = []
+        self._sizes: list[int] = []
+        self.memory_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._spill_offsets) + len(self._events)
+
+    @property
+    def spilled(self) -> int:
+        return len(self._spill_offsets)
+
+    def append(self, event: dict) -> None:
+        size = _estimate_size(event)
+        self._events.append(event)
+        self._sizes.append(size)
+        self.memory_bytes += size
+        self.touched = time.time()
+        if event.get("type") in ("done", "error"):
+            self.status = "cancelled" if event.get("cancelled") else event["type"]
+
+    def run_hook(self, event: dict) -> None:
+        if self.on_event is not None:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                transcriber._safe_print(f"[jobs] event hook failed for {self.id}: {e}", flush=True)
+
+    def close(self) -> None:
+        """
+        Called by the worker thread once it stops appending. Events appended
+        after the job was removed never reach on_event, so this is where a
+        buffering hook persists what it still holds.
+        """
+        if self.on_close is not None:
+            try:
+                self.on_close()
+            except Exception as e:
+                transcriber._safe_print(f"[jobs] close hook failed for {self.id}: {e}", flush=True)
+
+    def spill(self, count: int | None = None, lock=None) -> int:
+        """
+        Move the oldest `count` (default: all) in-memory events to disk. Returns
+        bytes freed. `lock` (the registry lock, not held by the caller) is only
+        taken to snapshot and then drop the events, not during the file write;
+        meanwhile readers keep serving them from memory.
+        """
+        lock = lock or threading.Lock()
+        with self._spill_lock:
+            with lock:
+                if self.removed:
+                    return 0
+                count = len(self._events) if count is None else min(count, len(self._events))
+                events = self._events[:count]
+            if not events:
+                return 0
+            offsets = array("q")
+            end = self._spill_end
+            with open(self._spill_path, "ab") as f:
+                for event in events:
+                    line = (json.dumps(event) + "\n").encode("utf-8")
+                    offsets.append(end)
+                    f.write(line)
+                    end += len(line)
+            with lock:
+                # Appends only add to the end and reset()/remove() take _spill_lock
+                # first, so the first `count` events are still the ones written.
+                self._spill_offsets.extend(offsets)
+                self._spill_end = end
+                freed = sum(self._sizes[:count])
+                del self._events[:count]
+                del self._sizes[:count]
+                self.memory_bytes -= freed
+            return freed
+
+    def read(self, start: int, limit: int = 500) -> list[dict]:
+        """Return up to `limit` events starting at index `start`."""
+        self.touched = time.time()
+        out: list[dict] = []
+        spilled = len(self._spill_offsets)
+        if start < spilled:
+            with open(self._spill_path, "rb") as f:
+                f.seek(self._spill_offsets[start])
+                for _ in range(min(limit, spilled - start)):
+                    out.append(json.loads(f.readline()))
+        mem_start = max(0, start - spilled)
+        out.extend(self._events[mem_start:mem_start + limit - len(out)])
+        return out
+
+    def reset(self) -> None:
+        """Forget all events (used when a job restarts, e.g. CUDA → CPU fallback)."""
+        self._discard_spill()
+        self._events.clear()
+        self._sizes.clear()
+        self.memory_bytes = 0
+        self.status = "running"
+        self.touched = time.time()
+
+    def _discard_spill(self) -> None:
+        if self._spill_offsets:
+            try:
+                os.unlink(self._spill_path)
+            except OSError:
+                pass
+        self._spill_offsets = array("q")
+        self._spill_end = 0
+
+    def info(self) -> dict:
+        now = time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "done": self.done,
+            "cancelled": self.cancelled,
+            "age_s": round(now - self.created, 1),
+            "idle_s": round(now - self.touched, 1),
+            "events": len(self),
+            "spilled_events": self.spilled,
+            "memory_bytes": self.memory_bytes,
+        }
+
+
+class JobRegistry:
+    """Thread-safe: jobs are written from worker threads and read from the event loop."""
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._total = 0  # estimated in-memory bytes across all jobs
+        self._last_collect = 0.0
+        self._spill_dir: str | None = None
+        self._sweeper: threading.Thread | None = None
+
+    def _get_spill_dir(self) -> str:
+        if self._spill_dir is None:
+            root = os.path.join(transcriber.get_data_dir(), "jobs")
+            tag = _process_tag(os.getpid())
+            self._spill_dir = os.path.join(root, tag)
+            os.makedirs(self._spill_dir, exist_ok=True)
+            # Directories of processes that have exited belong to jobs that no longer exist
+            import psutil
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                pid, _, _ = name.partition("-")
+                if name == tag or not os.path.isdir(path) or not pid.isdigit():
+                    continue
+                try:
+                    alive = _process_tag(int(pid)) == name
+                except psutil.Error:
+                    continue  # exists but can't be inspected (another user's process): leave it
+                if not alive:
+                    shutil.rmtree(path, ignore_errors=True)
+        return self._spill_dir
+
+    def create(self, job_id: str, kind: str = "transcribe", on_event=None, on_close=None) -> Job:
+        self.collect()
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep, daemon=True, name="job-sweeper")
+            self._sweeper.start()
+        job = Job(job_id, kind, self._get_spill_dir(), on_event, on_close)
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._jobs
+
+    def append(self, job_id: str, event: dict) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return  # dropped by an admin or expired; the worker stops at its next check
+            job.append(event)
+            self._total += job._sizes[-1]
+            oversized = len(job._events) > MAX_EVENTS_IN_MEMORY
+            over_ceiling = self._total > MAX_MEMORY_BYTES
+        if oversized:
+            self._spill(job, len(job._events) // 2)
+        if over_ceiling:
+            self._enforce_ceiling()
+        job.run_hook(event)
+
+    def _spill(self, job: Job, count: int | None = None) -> None:
+        freed = job.spill(count, self._lock)
+        with self._lock:
+            self._total -= freed
+
+    def read(self, job_id: str, start: int) -> list[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.read(start) if job is not None else []
+
+    def reset(self, job_id: str) -> None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        with job._spill_lock, self._lock:
+            self._total -= job.memory_bytes
+            job.reset()
+
+    def finish(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.done = True
+                job.touched = time.time()
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancelled = True
+        return True
+
+    def is_cancelled(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        return job is None or job.cancelled
+
+    def remove(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        with job._spill_lock, self._lock:
+            if self._jobs.pop(job_id, None) is None:
+                return False
+            self._total -= job.memory_bytes
+            job.removed = True
+            job._discard_spill()
+            return True
+
+    # ── Housekeeping ─────────────────────────────────────────────────────────
+
+    def _enforce_ceiling(self) -> None:
+        with self._lock:
+            biggest = sorted(self._jobs.values(), key=lambda j: j.memory_bytes, reverse=True)
+        for job in biggest:
+            if self._total <= MAX_MEMORY_BYTES * 0.75:
+                break
+            self._spill(job)
+
+    def _sweep(self) -> None:
+        while True:
+            time.sleep(COLLECT_INTERVAL)
+            try:
+                self.collect(force=True)
+            except Exception as e:
+                transcriber._safe_print(f"[jobs] sweep failed: {e}", flush=True)
+
+    def collect(self, force: bool = False) -> int:
+        """Drop expired jobs. Returns how many were removed."""
+        now = time.time()
+        if not force and now - self._last_collect < COLLECT_INTERVAL:
+            return 0
+        self._last_collect = now
+        expired = [
+            job.id for job in list(self._jobs.values())
+            if now - job.touched > IDLE_TTL or (job.done and now - job.touched > FINISHED_TTL)
+        ]
+        for job_id in expired:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.done:
+                job.cancelled = True  # let a stuck worker stop at its next check
+            self.remove(job_id)
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "memory_bytes": self._total,
+            "memory_ceiling_bytes": MAX_MEMORY_BYTES,
+            "finished_ttl_s": FINISHED_TTL,
+            "idle_ttl_s": IDLE_TTL,
+        }
+
+    def list(self) -> list[dict]:
+        self.collect()
+        with self._lock:
+            return [job.info() for job in self._jobs.values()]
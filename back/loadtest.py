@@ -0,0 +1,463 @@
+"""
+Load-testing harness for the realtime websocket and SSE transcription endpoints.
+
+Two sub-commands:
+
+    python loadtest.py serve --port 18766 --fake
+        Run the backend with a fake model and an event-loop lag probe exposed at
+        GET /loadtest/stats. Only the network inside WhisperModel is faked (see
+        FakeEngine), so decoding, VAD and batching are the real code paths.
+
+    python loadtest.py run --url http://127.0.0.1:18766 --ws-clients 16 --sse-clients 4
+        Replay utterances (recorded files via --audio, or synthetic WAV) over many
+        concurrent /ws/realtime sessions and /transcribe SSE subscribers, then
+        report p50/p95/p99 latency, busy/error rates, throughput and server loop lag.
+
+`run --spawn-fake` starts a `serve` subprocess itself so a capacity run is one
+reproducible command.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import urllib.parse
+import urllib.request
+import wave
+from collections import deque
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+LAG_PROBE_INTERVAL = 0.05   # seconds between event-loop lag samples
+FAKE_ENCODE_MS = 60.0       # fake encoder cost per 30-s window
+FAKE_TOKEN_MS = 8.0         # fake decoder cost per decoding step
+
+
+# ─── Shared helpers ──────────────────────────────────────────────────────────
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 4),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def synthetic_utterance(seconds: float, seed: int) -> bytes:
+    """A WAV clip of harmonic bursts, roughly shaped like speech energy."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    f0 = rng.uniform(100, 220)
+    voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+    syllables = (np.sin(2 * np.pi * rng.uniform(3, 5) * t) > 0).astype(np.float32)
+    pcm = (0.2 * voice * syllables + 0.01 * rng.standard_normal(t.size)).clip(-1, 1)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLING_RATE)
+        w.writeframes((pcm * 32767).astype(np.int16).tobytes())
+    return buf.getvalue()
+
+
+# ─── serve: backend with a fake model ────────────────────────────────────────
+
+class FakeEngine:
+    """
+    Stand-in for the ctranslate2 Whisper engine inside a real WhisperModel, so
+    the server runs its real decode, VAD, batching and segment-mapping code and
+    only the neural network is simulated. Costs:
+      • encode: encode_s per 30-s window, per batch item (no batching discount);
+      • generate: token_s per decoding step, shared by every item in the batch,
+        because a batch is decoded in lockstep.
+    Windows with sound yield one segment of a few words; silent windows yield a
+    one-word hallucination with a high no-speech probability and low log-prob.
+    """
+
+    is_multilingual = True
+    n_mels = 80
+    device = "cpu"
+    device_index = [0]
+
+    def __init__(self, encode_s: float, token_s: float, timestamp_begin: int, word_ids: list[int]):
+        self.encode_s = encode_s
+        self.token_s = token_s
+        self.timestamp_begin = timestamp_begin
+        self.word_ids = word_ids
+
+    def encode(self, features, to_cpu: bool = False) -> np.ndarray:
+        features = np.asarray(features)
+        time.sleep(self.encode_s * features.shape[0])
+        return features
+
+    def detect_language(self, encoder_output) -> list:
+        return [[("<|en|>", 0.98), ("<|ko|>", 0.02)] for _ in range(encoder_output.shape[0])]
+
+    def generate(self, encoder_output, prompts, max_length: int = 448, **kwargs) -> list:
+        results = []
+        for item in encoder_output:
+            # Whisper's log-mel sits at its floor where the input is silent; padded
+            # frames are exactly zero
+            peak, trough = item.max(axis=0), item.min(axis=0)
+            active = np.flatnonzero((peak > item.min() + 0.5) & ~((peak == 0) & (trough == 0)))
+            seconds = active.size / 100
+            if seconds < 0.3:
+                # Like Whisper on silence: a low-confidence hallucination the caller must drop
+                tokens, score, no_speech = [self.timestamp_begin, self.word_ids[0], self.timestamp_begin + 50], -2.0, 0.9
+            else:
+                words = [self.word_ids[k % len(self.word_ids)] for k in range(max(1, int(seconds * 2.5)))]
+                end = self.timestamp_begin + min(1500, int(active[-1] / 100 / 0.02))
+                begin = self.timestamp_begin + int(active[0] / 100 / 0.02)
+                tokens, score, no_speech = [begin, *words, end], -0.2, 0.02
+            results.append(types.SimpleNamespace(
+                sequences_ids=[tokens[: max_length]], scores=[score], no_speech_prob=no_speech,
+            ))
+        time.sleep(self.token_s * max((len(r.sequences_ids[0]) for r in results), default=0))
+        return results
+
+
+def fake_whisper_model(encode_s: float, token_s: float):
+    """A real faster_whisper.WhisperModel whose engine and tokenizer are fakes."""
+    import tokenizers
+    from faster_whisper import WhisperModel
+    from faster_whisper.feature_extractor import FeatureExtractor
+    from faster_whisper.tokenizer import _LANGUAGE_CODES
+    from faster_whisper.utils import get_logger
+
+    words = ["fake", "words", "for", "load", "testing"]
+    specials = (
+        ["<|endoftext|>", "<|startoftranscript|>"]
+        + [f"<|{code}|>" for code in _LANGUAGE_CODES]
+        + ["<|translate|>", "<|transcribe|>", "<|startoflm|>", "<|startofprev|>", "<|nospeech|>",
+           "<|notimestamps|>"]  # must stay last: timestamp tokens follow it
+    )
+    vocab = {token: i for i, token in enumerate(["<unk>", *words, *specials])}
+    hf_tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="<unk>"))
+    hf_tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    hf_tokenizer.add_special_tokens(specials)
+
+    model = WhisperModel.__new__(WhisperModel)
+    model.logger = get_logger()
+    model.hf_tokenizer = hf_tokenizer
+    model.feat_kwargs = {}
+    model.feature_extractor = FeatureExtractor()
+    model.input_stride = 2
+    model.num_samples_per_token = model.feature_extractor.hop_length * model.input_stride
+    model.frames_per_second = model.feature_extractor.sampling_rate // model.feature_extractor.hop_length
+    model.tokens_per_second = model.feature_extractor.sampling_rate // model.num_samples_per_token
+    model.time_precision = 0.02
+    model.max_length = 448
+    model.model = FakeEngine(
+        encode_s, token_s, vocab["<|notimestamps|>"] + 1, [vocab[w] for w in words],
+    )
+    return model
+
+
+def serve(host: str, port: int, fake: bool, encode_ms: float, token_ms: float) -> None:
+    import uvicorn
+
+    import main
+    import transcriber
+
+    if fake:
+        model = fake_whisper_model(encode_ms / 1000.0, token_ms / 1000.0)
+        transcriber.load_model = lambda model_name, **kwargs: model
+        transcriber.is_model_downloaded = lambda model_name: True
+        transcriber.get_loaded_model_name = lambda: "fake"
+
+    lags: deque[float] = deque(maxlen=20_000)
+
+    async def probe_loop_lag() -> None:
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lags.append(time.perf_counter() - t0 - LAG_PROBE_INTERVAL)
+
+    async def start_probe() -> None:
+        asyncio.get_event_loop().create_task(probe_loop_lag())
+
+    def loadtest_stats(reset: bool = False):
+        report = percentiles(list(lags))
+        if reset:
+            lags.clear()
+        return report
+
+    main.app.router.on_startup.append(start_probe)
+    main.app.add_api_route("/loadtest/stats", loadtest_stats, methods=["GET"])
+    uvicorn.run(main.app, host=host, port=port, log_level="warning")
+
+
+# ─── run: load generator ─────────────────────────────────────────────────────
+
+async def ws_client(
+    url: str, model: str, language: str | None, utterances: list[tuple[bytes, float]],
+    count: int, interval: float, client_idx: int, results: dict,
+) -> None:
+    import websockets
+
+    ws_url = urllib.parse.urljoin(url.replace("http", "ws", 1), "/ws/realtime")
+    try:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            await ws.send(json.dumps({"model": model, "language": language}))
+            for i in range(count):
+                audio, seconds = utterances[(client_idx + i) % len(utterances)]
+                t0 = time.perf_counter()
+                await ws.send(audio)
+                while True:
+                    msg = json.loads(await ws.recv())
+                    kind = msg.get("type")
+                    if kind == "segment":
+                        continue
+                    if kind == "done":
+                        results["latency"].append(time.perf_counter() - t0)
+                        results["audio_seconds"] += seconds
+                    else:
+                        results[kind if kind in ("busy", "error") else "error"] += 1
+                    break
+                results["sent"] += 1
+                await asyncio.sleep(interval)
+    except Exception as e:
+        results["connect_errors"].append(f"{type(e).__name__}: {e}")
+
+
+def _sse_job(url: str, model: str, language: str | None, file_path: str) -> dict:
+    """Blocking: start one /transcribe job and follow its stream to the end."""
+    body = json.dumps({"file_path": file_path, "model": model, "language": language}).encode()
+    t0 = time.perf_counter()
+    req = urllib.request.Request(
+        urllib.parse.urljoin(url, "/transcribe"), data=body,
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        job_id = json.load(resp)["job_id"]
+
+    first_event = None
+    events = 0
+    outcome = "error"
+    stream_url = urllib.parse.urljoin(url, f"/transcribe/{job_id}/stream")
+    with urllib.request.urlopen(stream_url, timeout=600) as resp:
+        for raw in resp:
+            line = raw.decode("utf-8").strip()
+            if not line.startswith("data: "):
+                continue
+            events += 1
+            if first_event is None:
+                first_event = time.perf_counter() - t0
+            kind = json.loads(line[6:]).get("type")
+            if kind in ("done", "error"):
+                outcome = kind
+                break
+    return {
+        "latency": time.perf_counter() - t0,
+        "first_event": first_event,
+        "events": events,
+        "outcome": outcome,
+    }
+
+
+async def sse_client(
+    url: str, model: str, language: str | None, files: list[tuple[str, float]],
+    count: int, client_idx: int, results: dict,
+) -> None:
+    for i in range(count):
+        file_path, seconds = files[(client_idx + i) % len(files)]
+        try:
+            r = await asyncio.to_thread(_sse_job, url, model, language, file_path)
+        except Exception as e:
+            results["connect_errors"].append(f"{type(e).__name__}: {e}")
+            continue
+        results["sent"] += 1
+        if r["outcome"] != "done":
+            results["error"] += 1
+            continue
+        results["latency"].append(r["latency"])
+        if r["first_event"] is not None:
+            results["first_event"].append(r["first_event"])
+        results["events"] += r["events"]
+        results["audio_seconds"] += seconds
+
+
+def _fetch_json(url: str) -> dict | None:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return json.load(resp)
+    except Exception:
+        return None
+
+
+def _wait_for_server(url: str, timeout: float = 60.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if _fetch_json(urllib.parse.urljoin(url, "/health")) is not None:
+            return
+        time.sleep(0.3)
+    raise RuntimeError(f"backend at {url} did not become healthy")
+
+
+async def run_load(args) -> dict:
+    if args.audio:
+        utterances = []
+        for path in args.audio:
+            with open(path, "rb") as f:
+                data = f.read()
+            from transcriber import get_audio_duration
+            utterances.append((data, get_audio_duration(path)))
+    else:
+        utterances = [
+            (synthetic_utterance(1.0 + (i % 5) * 0.5, seed=i), 1.0 + (i % 5) * 0.5)
+            for i in range(10)
+        ]
+
+    # SSE jobs need files the server can read
+    tmp_dir = tempfile.mkdtemp(prefix="whisper-loadtest-")
+    if args.audio:
+        files = [(os.path.abspath(p), s) for p, (_, s) in zip(args.audio, utterances)]
+    else:
+        files = []
+        for i, (data, seconds) in enumerate(utterances):
+            path = os.path.join(tmp_dir, f"utt{i}.wav")
+            with open(path, "wb") as f:
+                f.write(data)
+            files.append((path, seconds))
+
+    def new_results() -> dict:
+        return {
+            "sent": 0, "busy": 0, "error": 0, "events": 0, "audio_seconds": 0.0,
+            "latency": [], "first_event": [], "connect_errors": [],
+        }
+
+    ws_results, sse_results = new_results(), new_results()
+    _fetch_json(urllib.parse.urljoin(args.url, "/loadtest/stats?reset=true"))
+
+    t0 = time.perf_counter()
+    tasks = []
+    for i in range(args.ws_clients):
+        tasks.append(ws_client(
+            args.url, args.model, args.language, utterances,
+            args.utterances, args.interval, i, ws_results,
+        ))
+    for i in range(args.sse_clients):
+        tasks.append(sse_client(
+            args.url, args.model, args.language, files, args.jobs, i, sse_results,
+        ))
+
+    async def staggered(coro, delay):
+        await asyncio.sleep(delay)
+        await coro
+
+    await asyncio.gather(*(
+        staggered(c, i * args.ramp / max(1, len(tasks))) for i, c in enumerate(tasks)
+    ))
+    wall = time.perf_counter() - t0
+
+    def summarise(r: dict) -> dict:
+        completed = len(r["latency"])
+        return {
+            "sent": r["sent"],
+            "completed": completed,
+            "busy_rate": round(r["busy"] / r["sent"], 4) if r["sent"] else 0.0,
+            "error_rate": round(r["error"] / r["sent"], 4) if r["sent"] else 0.0,
+            "latency_s": percentiles(r["latency"]),
+            "throughput_per_s": round(completed / wall, 3),
+            "audio_seconds_per_s": round(r["audio_seconds"] / wall, 3),
+            "connect_errors": r["connect_errors"][:10],
+        }
+
+    report = {
+        "config": {
+            "url": args.url, "model": args.model, "ws_clients": args.ws_clients,
+            "sse_clients": args.sse_clients, "utterances": args.utterances,
+            "jobs": args.jobs, "interval": args.interval,
+            "audio": "recorded" if args.audio else "synthetic",
+        },
+        "wall_s": round(wall, 3),
+        "websocket": summarise(ws_results),
+        "sse": {
+            **summarise(sse_results),
+            "first_event_s": percentiles(sse_results["first_event"]),
+            "events": sse_results["events"],
+        },
+        "server_loop_lag_s": _fetch_json(urllib.parse.urljoin(args.url, "/loadtest/stats")),
+    }
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    return report
+
+
+def run(args) -> None:
+    server = None
+    if args.spawn_fake:
+        port = urllib.parse.urlparse(args.url).port or 18766
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port), "--fake",
+             "--fake-encode-ms", str(args.fake_encode_ms), "--fake-token-ms", str(args.fake_token_ms)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    try:
+        _wait_for_server(args.url)
+        report = asyncio.run(run_load(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    text = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the Whisper App backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="run the backend (optionally with a fake model)")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=18766)
+    p_serve.add_argument("--fake", action="store_true", help="use a fake model (see FakeEngine)")
+    p_serve.add_argument("--fake-encode-ms", type=float, default=FAKE_ENCODE_MS)
+    p_serve.add_argument("--fake-token-ms", type=float, default=FAKE_TOKEN_MS)
+
+    p_run = sub.add_parser("run", help="generate load against a running backend")
+    p_run.add_argument("--url", default="http://127.0.0.1:18766")
+    p_run.add_argument("--model", default="base")
+    p_run.add_argument("--language", default=None)
+    p_run.add_argument("--ws-clients", type=int, default=8)
+    p_run.add_argument("--sse-clients", type=int, default=2)
+    p_run.add_argument("--utterances", type=int, default=20, help="utterances per websocket client")
+    p_run.add_argument("--jobs", type=int, default=2, help="transcribe jobs per SSE client")
+    p_run.add_argument("--interval", type=float, default=0.5, help="pause between utterances (s)")
+    p_run.add_argument("--ramp", type=float, default=1.0, help="spread client start-up over this many seconds")
+    p_run.add_argument("--audio", nargs="*", help="recorded utterance files (default: synthetic)")
+    p_run.add_argument("--spawn-fake", action="store_true", help="start a fake-model server first")
+    p_run.add_argument("--fake-encode-ms", type=float, default=FAKE_ENCODE_MS)
+    p_run.add_argument("--fake-token-ms", type=float, default=FAKE_TOKEN_MS)
+    p_run.add_argument("--json", help="also write the report to this file")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.host, args.port, args.fake, args.fake_encode_ms, args.fake_token_ms)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,30 @@
 import asyncio
+import io
 import json
 import os
 import signal
 import subprocess
-import tempfile
 import threading
 import time
 import traceback
 import uuid
 from typing import AsyncGenerator
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+import cluster
+import framing
+import jobs
+import peaks
+import pipeline
+import realtime_batch
+import transcript_store
 import transcriber
+import tuning
 
 # Prevent SIGPIPE from crashing the server when a client disconnects mid-stream
 try:
@@ -32,10 +41,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory job store: job_id -> list of SSE event dicts (or "done"/"error")
-_jobs: dict[str, list[dict]] = {}
-_job_done: dict[str, asyncio.Event] = {}
-_cancelled_jobs: set[str] = set()
+# Job store: job_id -> SSE event log, with TTL expiry and disk spill (see jobs.py)
+_registry = jobs.JobRegistry()
+
+# Transcript store with full-text search (SQLite file is opened on first use)
+_transcripts = transcript_store.TranscriptStore(
+    os.path.join(transcriber.get_data_dir(), "transcripts.db")
+)
 
 # Lock to prevent concurrent access to the WhisperModel (not thread-safe)
 _model_lock = threading.Lock()
@@ -55,6 +67,11 @@ _MODEL_SIZE_MB: dict[str, int] = {str(m["name"]): int(str(m["size_mb"])) for m i
 CHUNK_DURATION = 900.0   # 15 minutes per chunk
 OVERLAP = 15.0           # 15-second overlap on each side of a boundary
 
+# Batched retranscription constants
+BATCH_SIZE = 8           # clips per encoder call
+BATCH_MAX_CLIP = 30.0    # Whisper's window; longer clips are transcribed one by one
+CLIP_MARGIN = 0.5        # extra seconds decoded around a clip for seek/resampler slack
+
 
 # ─── Health ──────────────────────────────────────────────────────────────────
 
@@ -76,19 +93,63 @@ def list_models():
     return AVAILABLE_MODELS
 
 
-class LoadModelRequest(BaseModel):
+class ModelOptions(BaseModel):
+    """Per-request overrides for the calibrated/default model settings."""
+    compute_type: str | None = None
+    cpu_threads: int | None = None
+    num_workers: int | None = None
+
+    def load_options(self) -> dict:
+        return {
+            "compute_type": self.compute_type,
+            "cpu_threads": self.cpu_threads,
+            "num_workers": self.num_workers,
+        }
+
+
+class LoadModelRequest(ModelOptions):
     model: str
 
 
 @app.post("/models/load")
 def load_model(req: LoadModelRequest):
     try:
-        transcriber.load_model(req.model)
+        transcriber.load_model(req.model, **req.load_options())
         return {"success": True, "model": req.model}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class CalibrateRequest(BaseModel):
+    sample_path: str | None = None
+    seconds: float = tuning.SAMPLE_SECONDS
+
+
+@app.post("/models/{model_name}/calibrate")
+def calibrate_model(model_name: str, req: CalibrateRequest):
+    """Benchmark compute types and thread splits for this machine and save the fastest."""
+    if not transcriber.is_model_downloaded(model_name):
+        raise HTTPException(status_code=404, detail="Model not downloaded")
+    # Running jobs would skew the timings, and the result is saved for good
+    busy = [j for j in _registry.list() if not j["done"] and j["kind"] != "download"]
+    if busy or _shard_lock.locked():
+        raise HTTPException(status_code=409, detail="Jobs are running; calibrate when the backend is idle")
+    # Calibration loads several model copies; keep realtime sessions out meanwhile
+    with _model_lock:
+        try:
+            return tuning.calibrate(model_name, req.sample_path, req.seconds)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/models/{model_name}/tuning")
+def get_model_tuning(model_name: str):
+    return {
+        "device": transcriber.get_device(),
+        "config": transcriber.get_tuned_config(model_name),
+    }
+
+
 # ─── Usage ───────────────────────────────────────────────────────────────────
 
 @app.get("/usage")
@@ -139,12 +200,11 @@ async def download_model_sse(model_name: str):
         )
 
     job_id = f"dl-{uuid.uuid4()}"
-    events: list[dict] = []
-    done_flag = threading.Event()
+    job = _registry.create(job_id, kind="download")
     error_list: list[str] = []
 
     def emit(event: dict) -> None:
-        events.append(event)
+        _registry.append(job_id, event)
 
     def do_download() -> None:
         try:
@@ -152,27 +212,27 @@ async def download_model_sse(model_name: str):
         except Exception as e:
             error_list.append(str(e))
         finally:
-            done_flag.set()
+            _registry.finish(job_id)
 
     threading.Thread(target=do_download, daemon=True).start()
 
     async def generator():
         sent = 0
-        while True:
-            while sent < len(events):
-                yield f"data: {json.dumps(events[sent])}\n\n"
-                sent += 1
-            if done_flag.is_set():
-                # Final flush
-                while sent < len(events):
-                    yield f"data: {json.dumps(events[sent])}\n\n"
+        try:
+            while True:
+                finished = job.done
+                for ev in _registry.read(job_id, sent):
+                    yield f"data: {json.dumps(ev)}\n\n"
                     sent += 1
-                if error_list:
-                    yield f"data: {json.dumps({'type': 'error', 'message': error_list[0]})}\n\n"
-                else:
-                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
-                return
-            await asyncio.sleep(0.3)
+                if finished and sent >= len(job):
+                    if error_list:
+                        yield f"data: {json.dumps({'type': 'error', 'message': error_list[0]})}\n\n"
+                    else:
+                        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                    return
+                await asyncio.sleep(0.3)
+        finally:
+            _registry.remove(job_id)
 
     return StreamingResponse(
         generator(),
@@ -205,23 +265,69 @@ def delete_model(model_name: str):
 
 # ─── Transcription ───────────────────────────────────────────────────────────
 
-class TranscribeRequest(BaseModel):
+class TranscribeRequest(ModelOptions):
     file_path: str
     model: str = "base"
     language: str | None = None
     start_ms: int | None = None
     end_ms: int | None = None
+    # When set, segments of a full-file job are written to the transcript store as they arrive
+    transcript_id: str | None = None
+    project_id: str | None = None
 
 
 @app.post("/transcribe")
 async def start_transcribe(req: TranscribeRequest):
     job_id = str(uuid.uuid4())
-    _jobs[job_id] = []
-    event = asyncio.Event()
-    _job_done[job_id] = event
+    writer = None
+    if req.transcript_id and req.start_ms is None:
+        writer = transcript_store.SegmentWriter(_transcripts, req.transcript_id, req.project_id)
+    _registry.create(job_id, on_event=writer, on_close=writer.flush if writer else None)
 
     loop = asyncio.get_event_loop()
-    loop.run_in_executor(None, _run_transcription, job_id, req.file_path, req.model, req.language, req.start_ms, req.end_ms)
+    loop.run_in_executor(
+        None, _run_transcription, job_id, req.file_path, req.model, req.language,
+        req.start_ms, req.end_ms, req.load_options(),
+    )
+
+    return {"job_id": job_id}
+
+
+class TranscribeRange(BaseModel):
+    id: str
+    start_ms: int
+    end_ms: int
+
+
+class BatchTranscribeRequest(ModelOptions):
+    file_path: str
+    model: str = "base"
+    language: str | None = None
+    ranges: list[TranscribeRange]
+
+
+@app.post("/transcribe/batch")
+async def start_batch_transcribe(req: BatchTranscribeRequest):
+    """
+    Retranscribe many segment ranges of one file as a single job.
+    Results stream through /transcribe/{job_id}/stream like a normal job,
+    with every segment tagged by the "range_id" it belongs to.
+    """
+    if not req.ranges:
+        raise HTTPException(status_code=400, detail="No ranges given")
+    for r in req.ranges:
+        if r.end_ms <= r.start_ms:
+            raise HTTPException(status_code=400, detail=f"Invalid range {r.id!r}")
+
+    job_id = str(uuid.uuid4())
+    _registry.create(job_id, kind="batch")
+
+    ranges = [(r.id, r.start_ms, r.end_ms) for r in req.ranges]
+    loop = asyncio.get_event_loop()
+    loop.run_in_executor(
+        None, _run_batch_transcription, job_id, req.file_path, req.model, req.language,
+        ranges, req.load_options(),
+    )
 
     return {"job_id": job_id}
 
@@ -229,10 +335,168 @@ async def start_transcribe(req: TranscribeRequest):
 @app.delete("/transcribe/{job_id}")
 async def cancel_transcription(job_id: str):
     """Signal the transcription worker to stop after the current segment."""
-    _cancelled_jobs.add(job_id)
+    _registry.cancel(job_id)
     return {"cancelled": True}
 
 
+# ─── Transcripts ─────────────────────────────────────────────────────────────
+
+class StoredSegment(BaseModel):
+    id: str
+    start_ms: int
+    end_ms: int
+    text: str
+    translated_text: str | None = None
+
+
+class SaveTranscriptRequest(BaseModel):
+    project_id: str | None = None
+    target_language: str | None = None
+    segments: list[StoredSegment]
+
+
+@app.put("/transcripts/{transcript_id}")
+def save_transcript(transcript_id: str, req: SaveTranscriptRequest):
+    _transcripts.replace(
+        transcript_id, req.project_id, [s.model_dump() for s in req.segments], req.target_language,
+    )
+    return {"success": True, "total": len(req.segments)}
+
+
+@app.get("/transcripts/{transcript_id}")
+def get_transcript_segments(transcript_id: str, offset: int = 0, limit: int = 200):
+    page = _transcripts.get_segments(transcript_id, max(0, offset), min(max(1, limit), 2000))
+    if page is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return page
+
+
+@app.delete("/transcripts/{transcript_id}")
+def delete_transcript(transcript_id: str):
+    if not _transcripts.delete(transcript_id):
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return {"success": True}
+
+
+@app.get("/search")
+def search_transcripts(q: str, project_id: str | None = None, limit: int = 50, offset: int = 0):
+    """Ranked full-text search over all stored segments, with timestamps for each hit."""
+    return {"query": q, "hits": _transcripts.search(q, project_id, min(max(1, limit), 500), max(0, offset))}
+
+
+# ─── Waveform peaks ──────────────────────────────────────────────────────────
+
+@app.get("/peaks/info")
+def get_peaks_info(file_path: str):
+    """Pyramid layout and generation progress; starts generation on first call."""
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    cache_dir, meta = peaks.ensure(file_path)
+    return {
+        **meta,
+        "sample_rate": peaks.SAMPLE_RATE,
+        "levels": [
+            {
+                "level": level,
+                "samples_per_peak": peaks.samples_per_peak(level),
+                "available": peaks.available_peaks(cache_dir, level),
+            }
+            for level in range(peaks.LEVELS)
+        ],
+    }
+
+
+@app.get("/peaks")
+def get_peaks(file_path: str, start: float = 0.0, end: float | None = None, width: int = 1000):
+    """
+    Min/max peaks for [start, end) seconds at roughly `width` points, as raw int8
+    [min, max] pairs (scale ±127). While generation is still running the range
+    is cut at what has been decoded so far; X-Peaks-Complete tells the client
+    whether to poll again. A failed generation answers 500 so polling stops.
+    """
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    cache_dir, meta = peaks.ensure(file_path)
+    if meta.get("error"):
+        raise HTTPException(status_code=500, detail=f"Peak generation failed: {meta['error']}")
+
+    if end is None:
+        end = meta.get("decoded_seconds") or transcriber.get_audio_duration(file_path)
+    start = max(0.0, start)
+    level = peaks.choose_level(start, max(end, start), width)
+    spp = peaks.samples_per_peak(level)
+    first = int(start * peaks.SAMPLE_RATE) // spp
+    last = min(-(-int(end * peaks.SAMPLE_RATE) // spp), peaks.available_peaks(cache_dir, level))
+    count = max(0, last - first)
+
+    return StreamingResponse(
+        peaks.iter_slice(cache_dir, level, first, count),
+        media_type="application/octet-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Peaks-Level": str(level),
+            "X-Peaks-Samples-Per-Peak": str(spp),
+            "X-Peaks-Sample-Rate": str(peaks.SAMPLE_RATE),
+            "X-Peaks-Start": str(first * spp / peaks.SAMPLE_RATE),
+            "X-Peaks-Count": str(count),
+            "X-Peaks-Complete": "1" if meta.get("complete") else "0",
+        },
+    )
+
+
+# ─── Job admin ───────────────────────────────────────────────────────────────
+
+@app.get("/jobs")
+def list_jobs():
+    return {**_registry.stats(), "items": _registry.list()}
+
+
+@app.delete("/jobs/{job_id}")
+def delete_job(job_id: str):
+    """Cancel a job (if still running) and drop its events immediately."""
+    _registry.cancel(job_id)
+    if not _registry.remove(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True}
+
+
+# ─── Cluster (chunk sharding, see cluster.py) ────────────────────────────────
+
+# Read-only: peers receive the speech audio of every long-file job, so they are
+# configured only through WHISPER_APP_PEERS, never over this open-CORS API
+@app.get("/cluster/peers")
+def list_peers():
+    return {"peers": [p.info() for p in cluster.get_peers()]}
+
+
+# One shard at a time per backend; a coordinator never sends a peer more than one anyway
+_shard_lock = threading.Lock()
+
+
+@app.post("/shard/transcribe")
+async def shard_transcribe(request: Request, model: str, language: str | None = None, sample_rate: int = 16000):
+    """
+    Transcribe one chunk for a coordinating backend. The body is little-endian
+    16-bit mono PCM of speech only; segment times are relative to it.
+    """
+    if not transcriber.is_model_downloaded(model):
+        raise HTTPException(status_code=409, detail="Model not downloaded")
+    body = await request.body()
+    if len(body) % 2:
+        raise HTTPException(status_code=400, detail="Body is not 16-bit PCM")
+    audio = np.frombuffer(body, dtype="<i2").astype(np.float32) / 32768.0
+
+    def run():
+        with _shard_lock:
+            m = transcriber.load_model(model)
+            if sample_rate != m.feature_extractor.sampling_rate:
+                raise HTTPException(status_code=400, detail=f"Expected {m.feature_extractor.sampling_rate} Hz audio")
+            return _transcribe_speech(m, audio, language)
+
+    detected, segments = await asyncio.get_event_loop().run_in_executor(None, run)
+    return {"language": detected, "segments": [[start, end, text] for start, end, text in segments]}
+
+
 # ─── Model download with progress ────────────────────────────────────────────
 
 def _download_model_with_progress(model_name: str, job_id: str, emit_fn) -> bool:
@@ -274,7 +538,7 @@ def _download_model_with_progress(model_name: str, job_id: str, emit_fn) -> bool
 
     # ── Download each file individually ───────────────────────────────────────
     for i, filename in enumerate(files_to_dl):
-        if job_id in _cancelled_jobs:
+        if _registry.is_cancelled(job_id):
             return False
         try:
             hf_hub_download(repo_id=repo_id, filename=filename)
@@ -367,6 +631,32 @@ def _make_repeat_filter(max_consecutive: int = 4):
     return keep
 
 
+def _batched_segment_ok(seg, kwargs: dict) -> bool:
+    """
+    BatchedInferencePipeline decodes once at temperatures[0] and never applies
+    no_speech_threshold/log_prob_threshold, so apply transcribe()'s silence
+    rule to its segments ourselves.
+    """
+    return not (
+        seg.no_speech_prob > kwargs['no_speech_threshold']
+        and seg.avg_logprob < kwargs['log_prob_threshold']
+    )
+
+
+def _batched_clip_index(model, starts: list[float]) -> dict[int, int]:
+    """
+    Map BatchedInferencePipeline segments back to their clip. Timestamps are
+    not capped at the clip's end, so a late one would land in the next clip
+    by start time; seg.seek is int(clip offset * frames_per_second) for every
+    segment of a clip, so key the clips the same way.
+    """
+    sampling_rate = model.feature_extractor.sampling_rate
+    return {
+        int(int(start * sampling_rate) / sampling_rate * model.frames_per_second): k
+        for k, start in enumerate(starts)
+    }
+
+
 # ─── Core transcription helpers ───────────────────────────────────────────────
 
 def _do_transcription(
@@ -379,13 +669,25 @@ def _do_transcription(
 ) -> None:
     """
     Transcribe a specific clip (used for per-segment retranscription).
-    Emits SSE events directly to _jobs[job_id].
+    Emits SSE events directly to the job's event log.
+
+    For clips only the requested window (plus CLIP_MARGIN) is decoded, by
+    seeking in the file, and segment times are shifted back to absolute time.
     """
+    audio = file_path
+    offset = 0.0
     clip_timestamps = None
     if start_ms is not None:
         start_sec = start_ms / 1000.0
         end_sec = end_ms / 1000.0 if end_ms is not None else None
-        clip_timestamps = f"{start_sec},{end_sec}" if end_sec is not None else str(start_sec)
+        audio, offset = transcriber.decode_audio_range(
+            file_path,
+            max(0.0, start_sec - CLIP_MARGIN),
+            end_sec + CLIP_MARGIN if end_sec is not None else None,
+            model.feature_extractor.sampling_rate,
+        )
+        rel_start = max(0.0, start_sec - offset)
+        clip_timestamps = f"{rel_start},{end_sec - offset}" if end_sec is not None else str(rel_start)
 
     kwargs: dict = {
         **_TRANSCRIBE_KWARGS_BASE,
@@ -394,14 +696,13 @@ def _do_transcription(
     if clip_timestamps is not None:
         kwargs['clip_timestamps'] = clip_timestamps
 
-    segments, info = model.transcribe(file_path, **kwargs)
+    segments, info = model.transcribe(audio, **kwargs)
     repeat_filter = _make_repeat_filter()
     segment_list: list[dict] = []
 
     for seg in segments:
-        if job_id in _cancelled_jobs:
-            _cancelled_jobs.discard(job_id)
-            _jobs[job_id].append({
+        if _registry.is_cancelled(job_id):
+            _registry.append(job_id, {
                 "type": "done",
                 "language": info.language,
                 "total_segments": len(segment_list),
@@ -416,21 +717,23 @@ def _do_transcription(
         event = {
             "type": "segment",
             "id": str(len(segment_list)),
-            "start": seg.start,
-            "end": seg.end,
+            "start": seg.start + offset,
+            "end": seg.end + offset,
             "text": text,
         }
-        _jobs[job_id].append(event)
+        _registry.append(job_id, event)
         segment_list.append(event)
 
-    _jobs[job_id].append({
+    _registry.append(job_id, {
         "type": "done",
         "language": info.language,
         "total_segments": len(segment_list),
     })
 
 
-def _do_full_transcription(job_id: str, model, file_path: str, language: str | None) -> None:
+def _do_full_transcription(
+    job_id: str, model, file_path: str, language: str | None, model_name: str,
+) -> None:
     """
     Transcribe an entire file, using 15-minute chunks with 15-second overlap to
     prevent Whisper hallucination on long audio (≥15 min).
@@ -456,17 +759,40 @@ def _do_full_transcription(job_id: str, model, file_path: str, language: str | N
         i += 1
 
     # ── Transcribe each chunk ─────────────────────────────────────────────────
+    # Decoding and VAD run ahead in background threads (see pipeline.py), so
+    # inference here only ever waits on the model.
+    from faster_whisper.vad import SpeechTimestampsMap, collect_chunks
+
     all_segments: list[dict] = []
     detected_language: str | None = None
     # Single repeat-filter shared across all chunks so runs spanning a boundary are caught
     repeat_filter = _make_repeat_filter()
+    sampling_rate = model.feature_extractor.sampling_rate
+    chunk_pipeline = pipeline.ChunkPipeline(file_path, chunks, sampling_rate=sampling_rate)
 
-    for chunk_idx, (clip_start, clip_end, boundary_start, is_last) in enumerate(chunks):
-        boundary_end = boundary_start + CHUNK_DURATION
+    def finish(cancelled: bool = False) -> None:
+        stats = chunk_pipeline.stats()
+        try:
+            print(f"[backend] pipeline stats: {json.dumps(stats)}", flush=True)
+        except (BrokenPipeError, OSError):
+            pass
+        _registry.append(job_id, {"type": "pipeline_stats", "stages": stats})
+        event = {
+            "type": "done",
+            "language": detected_language or "unknown",
+            "total_segments": len(all_segments),
+        }
+        if cancelled:
+            event["cancelled"] = True
+        _registry.append(job_id, event)
 
+    def announce(item: dict) -> None:
+        clip_start, clip_end = item["clip_start"], item["clip_end"]
+        boundary_start, is_last = item["boundary_start"], item["is_last"]
+        boundary_end = boundary_start + CHUNK_DURATION
         try:
             print(
-                f"[backend] chunk {chunk_idx + 1}/{len(chunks)}: "
+                f"[backend] chunk {item['index'] + 1}/{len(chunks)}: "
                 f"{clip_start:.0f}s–{clip_end:.0f}s "
                 f"(keeping [{boundary_start:.0f}s, {'end' if is_last else f'{boundary_end:.0f}s'}])",
                 flush=True,
@@ -475,59 +801,325 @@ def _do_full_transcription(job_id: str, model, file_path: str, language: str | N
             pass
 
         # === Add Chunk Progress Event to keep SSE connection alive and notify UI ===
-        _jobs[job_id].append({
+        _registry.append(job_id, {
             "type": "chunk_progress",
-            "chunk": chunk_idx + 1,
+            "chunk": item["index"] + 1,
             "total": len(chunks)
         })
 
-        kwargs: dict = {
-            **_TRANSCRIBE_KWARGS_BASE,
-            'language': detected_language or (language if language else None),
-            'clip_timestamps': f"{clip_start},{clip_end}",
+    def keep(item: dict, seg_start: float, seg_end: float, text: str) -> None:
+        # ── Boundary filter ───────────────────────────────────────────────────
+        if seg_start < item["boundary_start"]:
+            return
+        if not item["is_last"] and seg_start >= item["boundary_start"] + CHUNK_DURATION:
+            return
+
+        text = text.strip()
+        if not text or not repeat_filter(text):
+            return
+
+        event = {
+            "type": "segment",
+            "id": str(len(all_segments)),
+            "start": seg_start,
+            "end": seg_end,
+            "text": text,
         }
+        _registry.append(job_id, event)
+        all_segments.append(event)
+
+    # With peers configured, chunks are sharded across backends (see cluster.py)
+    peers = cluster.get_peers()
+    try:
+        if peers:
+            detected_language, completed = _do_sharded_chunks(
+                job_id, model, model_name, chunk_pipeline, language, peers, announce, keep,
+            )
+            if not completed:
+                finish(cancelled=True)
+                return
+        else:
+            for item in chunk_pipeline:
+                announce(item)
+                clip_start = item["clip_start"]
+                speech_chunks = item["speech_chunks"]
+                if not speech_chunks:
+                    continue
+
+                kwargs: dict = {
+                    **_TRANSCRIBE_KWARGS_BASE,
+                    'language': detected_language or (language if language else None),
+                    # VAD already ran in the pipeline; the model only sees speech
+                    'vad_filter': False,
+                }
+
+                speech_audio = np.concatenate(collect_chunks(item["audio"], speech_chunks, sampling_rate)[0])
+                ts_map = SpeechTimestampsMap(speech_chunks, sampling_rate)
+                segments, info = model.transcribe(speech_audio, **kwargs)
+
+                if detected_language is None:
+                    detected_language = info.language
+
+                for seg in segments:
+                    if _registry.is_cancelled(job_id):
+                        finish(cancelled=True)
+                        return
+
+                    keep(
+                        item,
+                        clip_start + ts_map.get_original_time(seg.start),
+                        clip_start + ts_map.get_original_time(seg.end, is_end=True),
+                        seg.text,
+                    )
+    finally:
+        chunk_pipeline.close()
 
-        segments, info = model.transcribe(file_path, **kwargs)
+    finish()
 
-        if detected_language is None:
-            detected_language = info.language
 
+def _transcribe_speech(model, audio: np.ndarray, language: str | None, is_cancelled=None):
+    """
+    Transcribe already VAD-trimmed audio in one go. Returns (language,
+    [(start, end, text), …]) with times relative to `audio`. Used for shards,
+    both by the coordinator's own model and by POST /shard/transcribe.
+    """
+    segments, info = model.transcribe(audio, **{
+        **_TRANSCRIBE_KWARGS_BASE,
+        'language': language,
+        'vad_filter': False,
+    })
+    out: list[tuple[float, float, str]] = []
+    for seg in segments:
+        if is_cancelled is not None and is_cancelled():
+            break
+        out.append((seg.start, seg.end, seg.text))
+    return info.language, out
+
+
+def _do_sharded_chunks(
+    job_id: str,
+    model,
+    model_name: str,
+    chunk_pipeline: pipeline.ChunkPipeline,
+    language: str | None,
+    peers: list[cluster.Peer],
+    announce,
+    keep,
+) -> tuple[str | None, bool]:
+    """
+    Run the chunks of _do_full_transcription on this model and every peer at
+    once, merging results back in chunk order through announce()/keep().
+    Returns (detected language, completed); completed is False if cancelled.
+    """
+    from faster_whisper.vad import SpeechTimestampsMap, collect_chunks
+
+    sampling_rate = model.feature_extractor.sampling_rate
+
+    def to_task(seq: int, item: dict) -> cluster.ShardTask:
+        speech_chunks = item["speech_chunks"]
+        meta = {k: v for k, v in item.items() if k != "audio"}
+        if not speech_chunks:
+            return cluster.ShardTask(seq, None, 0.0, meta)
+        audio = np.concatenate(collect_chunks(item["audio"], speech_chunks, sampling_rate)[0])
+        meta["ts_map"] = SpeechTimestampsMap(speech_chunks, sampling_rate)
+        return cluster.ShardTask(seq, audio, audio.size / sampling_rate, meta)
+
+    # Every shard must decode in the same language, so detect it up front from
+    # the first chunk with speech — the same 30 s a sequential run would use.
+    items = iter(chunk_pipeline)
+    head: list[cluster.ShardTask] = []
+    while language is None:
+        item = next(items, None)
+        if item is None:
+            break
+        head.append(to_task(len(head), item))
+        if head[-1].audio is not None:
+            language, _, _ = model.detect_language(
+                audio=head[-1].audio[:model.feature_extractor.n_samples]
+            )
+
+    def tasks():
+        yield from head
+        for seq, item in enumerate(items, start=len(head)):
+            yield to_task(seq, item)
+
+    workers = [
+        cluster.LocalWorker(
+            lambda audio, lang, should_stop: _transcribe_speech(
+                model, audio, lang, lambda: should_stop() or _registry.is_cancelled(job_id),
+            )
+        ),
+        *(cluster.PeerWorker(p, model_name, sampling_rate) for p in peers),
+    ]
+    scheduler = cluster.ShardScheduler(workers, language)
+    detected_language = language
+
+    def on_result(task: cluster.ShardTask, lang: str, segments: list) -> None:
+        nonlocal detected_language
+        item = task.meta
+        announce(item)
+        if detected_language is None and segments:
+            detected_language = lang
+        for start, end, text in segments:
+            keep(
+                item,
+                item["clip_start"] + item["ts_map"].get_original_time(start),
+                item["clip_start"] + item["ts_map"].get_original_time(end, is_end=True),
+                text,
+            )
+
+    try:
+        completed = scheduler.run(tasks(), on_result, lambda: _registry.is_cancelled(job_id))
+    finally:
+        stats = scheduler.stats()
+        try:
+            print(f"[backend] shard stats: {json.dumps(stats)}", flush=True)
+        except (BrokenPipeError, OSError):
+            pass
+        _registry.append(job_id, {"type": "shard_stats", **stats})
+    return detected_language, completed
+
+
+def _do_batch_transcription(
+    job_id: str,
+    model,
+    file_path: str,
+    language: str | None,
+    ranges: list[tuple[str, int, int]],
+) -> None:
+    """
+    Transcribe many (range_id, start_ms, end_ms) clips of one file.
+
+    Only the clips themselves are decoded (seeking in the file per range). Clips
+    that fit in Whisper's 30-second window are laid end to end and run through
+    BatchedInferencePipeline, so the encoder sees BATCH_SIZE clips per call;
+    longer clips fall back to a regular transcribe(). Emits a "segment" event
+    (tagged with range_id) per result, a "range_done" event after each range
+    and a final "done".
+    """
+    from faster_whisper import BatchedInferencePipeline
+
+    sampling_rate = model.feature_extractor.sampling_rate
+
+    # (range_id, pcm, absolute time of pcm[0])
+    short: list[tuple[str, np.ndarray, float]] = []
+    long: list[tuple[str, np.ndarray, float]] = []
+    for range_id, start_ms, end_ms in ranges:
+        clip, offset = transcriber.decode_audio_range(
+            file_path, start_ms / 1000.0, end_ms / 1000.0, sampling_rate,
+        )
+        (short if clip.size <= BATCH_MAX_CLIP * sampling_rate else long).append((range_id, clip, offset))
+
+    total_segments = 0
+    detected_language: str | None = None
+
+    def finish(cancelled: bool = False) -> None:
+        event = {
+            "type": "done",
+            "language": detected_language or "unknown",
+            "total_segments": total_segments,
+        }
+        if cancelled:
+            event["cancelled"] = True
+        _registry.append(job_id, event)
+
+    def emit(range_id: str, range_segments: list[dict], text: str, start: float, end: float) -> None:
+        nonlocal total_segments
+        event = {
+            "type": "segment",
+            "range_id": range_id,
+            "id": str(len(range_segments)),
+            "start": start,
+            "end": end,
+            "text": text,
+        }
+        _registry.append(job_id, event)
+        range_segments.append(event)
+        total_segments += 1
+
+    # ── Batched short clips ───────────────────────────────────────────────────
+    for range_id, clip, _ in short:
+        if not clip.size:  # range lies outside the file
+            _registry.append(job_id, {"type": "range_done", "range_id": range_id, "total_segments": 0})
+    short = [c for c in short if c[1].size]
+    if short:
+        positions: list[float] = []
+        position = 0
+        for _, clip, _ in short:
+            positions.append(position / sampling_rate)
+            position += clip.size
+        segments, info = BatchedInferencePipeline(model=model).transcribe(
+            np.concatenate([clip for _, clip, _ in short]),
+            **{
+                **_TRANSCRIBE_KWARGS_BASE,
+                'language': language if language else None,
+                'clip_timestamps': [
+                    {"start": pos, "end": pos + clip.size / sampling_rate}
+                    for pos, (_, clip, _) in zip(positions, short)
+                ],
+                'without_timestamps': False,
+                'batch_size': BATCH_SIZE,
+            },
+        )
+        detected_language = info.language
+
+        per_range: list[list[dict]] = [[] for _ in short]
+        repeat_filters = [_make_repeat_filter() for _ in short]
+        clip_index = _batched_clip_index(model, positions)
         for seg in segments:
-            if job_id in _cancelled_jobs:
-                _cancelled_jobs.discard(job_id)
-                _jobs[job_id].append({
-                    "type": "done",
-                    "language": detected_language or "unknown",
-                    "total_segments": len(all_segments),
-                    "cancelled": True,
-                })
+            if _registry.is_cancelled(job_id):
+                finish(cancelled=True)
                 return
-
-            # ── Boundary filter ───────────────────────────────────────────────
-            if seg.start < boundary_start:
+            k = clip_index.get(seg.seek)
+            if k is None:
+                continue
+            # Segment times are relative to the concatenated clips; keep them inside the range
+            range_end = positions[k] + short[k][1].size / sampling_rate
+            if seg.start >= range_end:
                 continue
-            if not is_last and seg.start >= boundary_end:
+            text = seg.text.strip()
+            if not text or not _batched_segment_ok(seg, _TRANSCRIBE_KWARGS_BASE) or not repeat_filters[k](text):
                 continue
+            shift = short[k][2] - positions[k]
+            emit(short[k][0], per_range[k], text, seg.start + shift, min(seg.end, range_end) + shift)
+
+        for k, (range_id, _, _) in enumerate(short):
+            _registry.append(job_id, {
+                "type": "range_done",
+                "range_id": range_id,
+                "total_segments": len(per_range[k]),
+            })
+
+    # ── Long clips (> 30 s) one at a time ─────────────────────────────────────
+    for range_id, clip, offset in long:
+        segments, info = model.transcribe(
+            clip,
+            **{
+                **_TRANSCRIBE_KWARGS_BASE,
+                'language': detected_language or (language if language else None),
+            },
+        )
+        if detected_language is None:
+            detected_language = info.language
 
+        repeat_filter = _make_repeat_filter()
+        range_segments: list[dict] = []
+        for seg in segments:
+            if _registry.is_cancelled(job_id):
+                finish(cancelled=True)
+                return
             text = seg.text.strip()
             if not text or not repeat_filter(text):
                 continue
+            emit(range_id, range_segments, text, seg.start + offset, seg.end + offset)
 
-            event = {
-                "type": "segment",
-                "id": str(len(all_segments)),
-                "start": seg.start,
-                "end": seg.end,
-                "text": text,
-            }
-            _jobs[job_id].append(event)
-            all_segments.append(event)
+        _registry.append(job_id, {
+            "type": "range_done",
+            "range_id": range_id,
+            "total_segments": len(range_segments),
+        })
 
-    _jobs[job_id].append({
-        "type": "done",
-        "language": detected_language or "unknown",
-        "total_segments": len(all_segments),
-    })
+    finish()
 
 
 def _is_cuda_error(msg: str) -> bool:
@@ -544,24 +1136,48 @@ def _run_transcription(
     language: str | None,
     start_ms: int | None = None,
     end_ms: int | None = None,
+    load_options: dict | None = None,
 ):
     def _run(m):
         if start_ms is not None:
             _do_transcription(job_id, m, file_path, language, start_ms, end_ms)
         else:
-            _do_full_transcription(job_id, m, file_path, language)
+            _do_full_transcription(job_id, m, file_path, language, model_name)
+
+    _run_job(job_id, model_name, _run, load_options)
 
+
+def _run_batch_transcription(
+    job_id: str,
+    file_path: str,
+    model_name: str,
+    language: str | None,
+    ranges: list[tuple[str, int, int]],
+    load_options: dict | None = None,
+):
+    _run_job(
+        job_id, model_name,
+        lambda m: _do_batch_transcription(job_id, m, file_path, language, ranges),
+        load_options,
+    )
+
+
+def _run_job(job_id: str, model_name: str, _run, load_options: dict | None = None) -> None:
+    """
+    Shared job lifecycle: download the model if needed, load it, call _run(model)
+    and retry once on CPU if CUDA fails. Always marks the job done at the end.
+    """
+    job = _registry.get(job_id)
     try:
         # ── Phase 1: Download model with progress if not cached ───────────────
         if not transcriber.is_model_downloaded(model_name):
             def emit_dl(event):
-                _jobs[job_id].append(event)
+                _registry.append(job_id, event)
 
             ok = _download_model_with_progress(model_name, job_id, emit_dl)
             if not ok:
                 # Cancelled during download
-                _cancelled_jobs.discard(job_id)
-                _jobs[job_id].append({
+                _registry.append(job_id, {
                     "type": "done",
                     "language": "",
                     "total_segments": 0,
@@ -570,8 +1186,8 @@ def _run_transcription(
                 return
 
         # ── Phase 2: Load model (instant when already cached) ─────────────────
-        _jobs[job_id].append({"type": "model_loaded", "model": model_name})
-        model = transcriber.load_model(model_name)
+        _registry.append(job_id, {"type": "model_loaded", "model": model_name})
+        model = transcriber.load_model(model_name, **(load_options or {}))
 
         # ── Phase 3: Transcribe ───────────────────────────────────────────────
         try:
@@ -583,8 +1199,9 @@ def _run_transcription(
                 except (BrokenPipeError, OSError):
                     pass
                 transcriber.disable_cuda()
+                # Overrides were chosen for the GPU; fall back to CPU defaults/tuning
                 model = transcriber.load_model(model_name)
-                _jobs[job_id] = []
+                _registry.reset(job_id)
                 _run(model)
             else:
                 raise
@@ -595,50 +1212,198 @@ def _run_transcription(
             print(f"[backend] transcription error:\n{tb}", flush=True)
         except (BrokenPipeError, OSError):
             pass
-        _jobs[job_id].append({"type": "error", "message": f"{e}\n\n{tb}"})
+        _registry.append(job_id, {"type": "error", "message": f"{e}\n\n{tb}"})
     finally:
-        _job_done[job_id].set()
+        _registry.finish(job_id)
+        if job is not None:
+            job.close()
 
 
 @app.get("/transcribe/{job_id}/stream")
-async def stream_transcription(job_id: str):
-    if job_id not in _jobs:
+async def stream_transcription(
+    job_id: str,
+    request: Request,
+    coalesce: bool = False,
+    coalesce_ms: int = int(framing.COALESCE_MAX_DELAY * 1000),
+    coalesce_max: int = framing.COALESCE_MAX_EVENTS,
+    compress: bool = False,
+):
+    """
+    SSE stream of a job's events, one JSON message per event by default.
+    ?coalesce=true groups consecutive segments into "batch" messages and
+    ?compress=true gzips the stream (if the client accepts gzip).
+    """
+    if job_id not in _registry:
         raise HTTPException(status_code=404, detail="Job not found")
 
+    coalescer = framing.SegmentCoalescer(coalesce_max, coalesce_ms / 1000.0) if coalesce else None
+
     async def event_generator() -> AsyncGenerator[str, None]:
         sent_index: int = 0
         last_yield_time = time.time()
         while True:
-            events = _jobs.get(job_id, [])
-            while sent_index < len(events):
-                ev = events[sent_index]
-                yield f"data: {json.dumps(ev)}\n\n"
+            if job_id not in _registry:
+                return  # expired or removed by an admin
+            frames: list[dict] = []
+            finished = False
+            for ev in _registry.read(job_id, sent_index):
                 sent_index += 1
-                last_yield_time = time.time()
+                frames.extend(coalescer.add(ev) if coalescer else [ev])
                 if ev["type"] in ("done", "error"):
-                    _jobs.pop(job_id, None)
-                    _job_done.pop(job_id, None)
-                    return
-            
+                    finished = True
+                    break
+            if coalescer:
+                frames.extend(coalescer.due())
+            if frames:
+                # One write per poll instead of one per event
+                yield "".join(framing.sse_frame(f) for f in frames)
+                last_yield_time = time.time()
+            if finished:
+                _registry.remove(job_id)
+                return
+
             # Keep connections alive during long GPU inferences with no segments
             if time.time() - last_yield_time > 15:
                 yield ": keepalive\n\n"
                 last_yield_time = time.time()
 
-            await asyncio.sleep(0.1)
+            delay = 0.1
+            if coalescer and coalescer.time_left() is not None:
+                delay = min(delay, coalescer.time_left())
+            await asyncio.sleep(delay)
 
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-        },
-    )
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    body = event_generator()
+    if compress and "gzip" in request.headers.get("accept-encoding", ""):
+        body = framing.gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(body, media_type="text/event-stream", headers=headers)
 
 
 # ─── Real-time transcription via WebSocket ────────────────────────────────────
 
+def _realtime_segments(
+    segs, detected_lang: str | None, offset: float = 0.0, duration: float | None = None,
+) -> list[dict]:
+    """
+    Filter realtime segments and turn them into websocket events (no "language"
+    if unknown). With a duration, times are kept inside [offset, offset + duration].
+    """
+    results = []
+    repeat_filter = _make_repeat_filter()
+    for seg in segs:
+        end = seg.end
+        if duration is not None:
+            if seg.start >= offset + duration:
+                continue
+            end = min(end, offset + duration)
+        text = seg.text.strip()
+        norm = text.lower().rstrip('.,!?…;: ')
+        if not text or not repeat_filter(text):
+            continue
+        if norm in _REALTIME_HALLUCINATIONS:
+            continue
+        event = {
+            "type": "segment",
+            "text": text,
+            "start": round(seg.start - offset, 2),
+            "end": round(end - offset, 2),
+        }
+        if detected_lang:
+            event["language"] = detected_lang
+        results.append(event)
+    return results
+
+
+def _transcribe_realtime_batch(model, language: str | None, utterances: list[bytes]) -> list:
+    """
+    Transcribe several utterances (raw WebM/… bytes) in one go.
+
+    A lone utterance takes the same path as before batching existed. Several
+    are decoded, laid end to end and run through BatchedInferencePipeline with
+    one clip per utterance; segments are mapped back by their clip's seek.
+    Returns one list of segment events (or an Exception) per utterance.
+
+    The pipeline skips no_speech_threshold, so silent clips are filtered here.
+    It detects language per clip but only reports the first, so batched
+    segments carry a "language" only when the session fixed one.
+    """
+    from faster_whisper import BatchedInferencePipeline, decode_audio
+
+    sampling_rate = model.feature_extractor.sampling_rate
+    results: list = [None] * len(utterances)
+    audios: list[tuple[int, np.ndarray]] = []
+    for i, data in enumerate(utterances):
+        try:
+            audios.append((i, decode_audio(io.BytesIO(data), sampling_rate=sampling_rate)))
+        except Exception as e:
+            results[i] = e
+
+    # Whisper only sees 30 s per batch item; longer (rare) utterances run alone
+    batchable = [(i, a) for i, a in audios if a.size <= BATCH_MAX_CLIP * sampling_rate]
+    single = [(i, a) for i, a in audios if a.size > BATCH_MAX_CLIP * sampling_rate]
+    if len(batchable) == 1:
+        single += batchable
+        batchable = []
+
+    for i, audio in single:
+        try:
+            segs, info = model.transcribe(audio, language=language, **_TRANSCRIBE_KWARGS_REALTIME)
+            results[i] = _realtime_segments(segs, info.language)
+        except Exception as e:
+            results[i] = e
+
+    if batchable:
+        offsets: list[float] = []
+        position = 0
+        for _, audio in batchable:
+            offsets.append(position / sampling_rate)
+            position += audio.size
+        try:
+            segs, _ = BatchedInferencePipeline(model=model).transcribe(
+                np.concatenate([a for _, a in batchable]),
+                language=language,
+                **{
+                    **_TRANSCRIBE_KWARGS_REALTIME,
+                    'clip_timestamps': [
+                        {"start": start, "end": start + audio.size / sampling_rate}
+                        for start, (_, audio) in zip(offsets, batchable)
+                    ],
+                    'without_timestamps': False,
+                    'multilingual': language is None,
+                    'batch_size': len(batchable),
+                },
+            )
+            per_clip: list[list] = [[] for _ in batchable]
+            clip_index = _batched_clip_index(model, offsets)
+            for seg in segs:
+                k = clip_index.get(seg.seek)
+                if k is not None and _batched_segment_ok(seg, _TRANSCRIBE_KWARGS_REALTIME):
+                    per_clip[k].append(seg)
+            for k, (i, audio) in enumerate(batchable):
+                results[i] = _realtime_segments(
+                    per_clip[k], language, offsets[k], audio.size / sampling_rate,
+                )
+        except Exception as e:
+            for i, _ in batchable:
+                results[i] = e
+
+    return results
+
+
+_realtime_batcher = realtime_batch.RealtimeBatcher(_transcribe_realtime_batch, _model_lock)
+
+
+@app.get("/realtime/stats")
+def realtime_stats():
+    return _realtime_batcher.stats()
+
+
 @app.websocket("/ws/realtime")
 async def realtime_ws(websocket: WebSocket):
     """
@@ -646,11 +1411,16 @@ async def realtime_ws(websocket: WebSocket):
 
     Protocol:
       1. Client sends JSON config:  {"model": "base", "language": "ko"}
+         (optionally with "compute_type", "cpu_threads", "num_workers" overrides, and
+         "stream": {"encoding": "json" | "msgpack", "coalesce": bool} — when given, the
+         server answers with a JSON {"type": "stream_options", ...} saying what it applied;
+         with coalesce each utterance's segments and its "done" arrive as one
+         {"type": "batch", "events": [...]} message)
       2. Client sends binary audio chunks (complete WebM utterances, one per message)
       3. Server transcribes each chunk and sends back:
            {"type": "segment", "text": "...", "start": 0.0, "end": 1.2, "language": "ko"}
            {"type": "done"}   — after all segments for that chunk
-           {"type": "busy"}   — if a file transcription is running concurrently
+           {"type": "busy"}   — if the model is held by another job or the realtime queue is full
            {"type": "error", "message": "..."}
     """
     await websocket.accept()
@@ -676,15 +1446,28 @@ async def realtime_ws(websocket: WebSocket):
         return
 
     try:
-        model = transcriber.load_model(model_name)
+        model = transcriber.load_model(
+            model_name,
+            compute_type=config.get("compute_type"),
+            cpu_threads=config.get("cpu_threads"),
+            num_workers=config.get("num_workers"),
+        )
     except Exception as e:
         print(f"[realtime] load_model failed: {e}", flush=True)
         await websocket.send_json({"type": "error", "message": f"모델 로드 실패: {e}"})
         await websocket.close()
         return
 
-    # Step 2: receive audio chunks and transcribe
-    loop = asyncio.get_event_loop()
+    stream_options = config.get("stream") or {}
+    encoder = framing.WebSocketEncoder(stream_options.get("encoding", "json"))
+    coalesce = bool(stream_options.get("coalesce"))
+    if stream_options:
+        # Always JSON text, so the client can read it whatever it asked for
+        await websocket.send_json({"type": "stream_options", "encoding": encoder.encoding, "coalesce": coalesce})
+
+    # Step 2: receive audio chunks; the batcher transcribes them together with
+    # utterances from other open sessions and hands back this session's results
+    _realtime_batcher.open_session()
     try:
         while True:
             # receive_bytes() raises WebSocketDisconnect when the client closes
@@ -696,64 +1479,26 @@ async def realtime_ws(websocket: WebSocket):
             if not audio_bytes:
                 continue
 
-            # Try to acquire the model lock (non-blocking)
-            acquired = _model_lock.acquire(blocking=False)
-            if not acquired:
-                await websocket.send_json({"type": "busy"})
-                continue
-
             try:
-                # Write utterance to temp file
-                with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
-                    f.write(audio_bytes)
-                    tmp_path = f.name
-
-                # Run transcription in thread executor to avoid blocking the event loop
-                def _transcribe_chunk():
-                    results = []
-                    detected_lang = "unknown"
-                    try:
-                        segs, info = model.transcribe(
-                            tmp_path,
-                            language=language,
-                            **_TRANSCRIBE_KWARGS_REALTIME,
-                        )
-                        detected_lang = info.language
-                        repeat_filter = _make_repeat_filter()
-                        for seg in segs:
-                            text = seg.text.strip()
-                            norm = text.lower().rstrip('.,!?…;: ')
-                            if not text or not repeat_filter(text):
-                                continue
-                            if norm in _REALTIME_HALLUCINATIONS:
-                                continue
-                            results.append({
-                                "type": "segment",
-                                "text": text,
-                                "start": round(seg.start, 2),
-                                "end": round(seg.end, 2),
-                                "language": detected_lang,
-                            })
-                    finally:
-                        try:
-                            os.unlink(tmp_path)
-                        except OSError:
-                            pass
-                    return results
-
-                segments_out = await loop.run_in_executor(None, _transcribe_chunk)
-
-                for seg_event in segments_out:
-                    await websocket.send_json(seg_event)
-                await websocket.send_json({"type": "done"})
-
+                segments_out = await _realtime_batcher.submit(model, language, audio_bytes)
+            except realtime_batch.Busy:
+                await encoder.send(websocket, {"type": "busy"})
+                continue
             except Exception as e:
                 try:
-                    await websocket.send_json({"type": "error", "message": str(e)})
+                    await encoder.send(websocket, {"type": "error", "message": str(e)})
                 except Exception:
                     pass
-            finally:
-                _model_lock.release()
+                continue
+
+            if coalesce:
+                await encoder.send(websocket, {"type": "batch", "events": [*segments_out, {"type": "done"}]})
+            else:
+                for seg_event in segments_out:
+                    await encoder.send(websocket, seg_event)
+                await encoder.send(websocket, {"type": "done"})
 
     except WebSocketDisconnect:
         pass
+    finally:
+        _realtime_batcher.close_session()
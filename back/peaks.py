@@ -0,0 +1,190 @@
+"""
+Multi-resolution waveform peaks for drawing and navigating long media.
+
+A file is decoded once with PyAV (transcriber.iter_audio_blocks) into a min/max
+pyramid: level 0 holds one [min, max] int8 pair per BASE_SAMPLES samples (10 ms
+at 16 kHz) and every further level merges LEVEL_FACTOR pairs of the level
+below. Each level is an append-only binary file under <data dir>/peaks/<key>/,
+so generation is incremental — requests are served from whatever has been
+written so far while a background thread keeps decoding.
+"""
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+import numpy as np
+
+import transcriber
+
+SAMPLE_RATE = 16000
+BASE_SAMPLES = 160          # samples per level-0 peak (10 ms)
+LEVEL_FACTOR = 4
+LEVELS = 6                  # 10 ms … ~10 s per peak
+FORMAT_VERSION = 1
+
+_generating: dict[str, threading.Thread] = {}
+_generating_lock = threading.Lock()
+
+
+def samples_per_peak(level: int) -> int:
+    return BASE_SAMPLES * LEVEL_FACTOR ** level
+
+
+def _cache_dir(file_path: str) -> str:
+    st = os.stat(file_path)
+    ident = f"{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime_ns}|{FORMAT_VERSION}"
+    key = hashlib.sha1(ident.encode("utf-8")).hexdigest()[:20]
+    return os.path.join(transcriber.get_data_dir(), "peaks", key)
+
+
+def _level_path(cache_dir: str, level: int) -> str:
+    return os.path.join(cache_dir, f"level{level}.bin")
+
+
+def _read_meta(cache_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cache_dir: str, meta: dict) -> None:
+    path = os.path.join(cache_dir, "meta.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+
+
+def _reduce(mins: np.ndarray, maxs: np.ndarray, factor: int) -> tuple[np.ndarray, np.ndarray]:
+    n = mins.size // factor * factor
+    return (
+        mins[:n].reshape(-1, factor).min(axis=1),
+        maxs[:n].reshape(-1, factor).max(axis=1),
+    )
+
+
+def _generate(file_path: str, cache_dir: str) -> None:
+    meta = {
+        "version": FORMAT_VERSION,
+        "sample_rate": SAMPLE_RATE,
+        "levels": [samples_per_peak(level) for level in range(LEVELS)],
+        "decoded_seconds": 0.0,
+        "complete": False,
+    }
+    files = []
+    # Leftovers that don't fill a whole peak yet: raw samples, then per-level pairs
+    carry_samples = np.zeros(0, dtype=np.float32)
+    carry = [(np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int8)) for _ in range(LEVELS)]
+    decoded = 0
+
+    def push(level: int, mins: np.ndarray, maxs: np.ndarray, final: bool) -> None:
+        files[level].write(np.stack([mins, maxs], axis=1).astype(np.int8).tobytes())
+        files[level].flush()
+        if level + 1 == LEVELS:
+            return
+        cmin = np.concatenate([carry[level][0], mins])
+        cmax = np.concatenate([carry[level][1], maxs])
+        up_min, up_max = _reduce(cmin, cmax, LEVEL_FACTOR)
+        used = up_min.size * LEVEL_FACTOR
+        carry[level] = (cmin[used:], cmax[used:])
+        if final and carry[level][0].size:
+            up_min = np.append(up_min, carry[level][0].min())
+            up_max = np.append(up_max, carry[level][1].max())
+            carry[level] = (np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int8))
+        if up_min.size or final:
+            push(level + 1, up_min, up_max, final)
+
+    try:
+        # Setup can fail too (disk full, permissions, a locked file on Windows);
+        # it must still end in an "error" meta and release _generating
+        os.makedirs(cache_dir, exist_ok=True)
+        for level in range(LEVELS):
+            open(_level_path(cache_dir, level), "wb").close()
+        _write_meta(cache_dir, meta)
+        files.extend(open(_level_path(cache_dir, level), "ab") for level in range(LEVELS))
+
+        for block in transcriber.iter_audio_blocks(file_path, SAMPLE_RATE, block_seconds=10.0):
+            decoded += block.size
+            samples = np.concatenate([carry_samples, block])
+            n = samples.size // BASE_SAMPLES * BASE_SAMPLES
+            carry_samples = samples[n:]
+            frames = samples[:n].reshape(-1, BASE_SAMPLES)
+            quantized = np.clip(np.round(frames * 127), -127, 127).astype(np.int8)
+            push(0, quantized.min(axis=1), quantized.max(axis=1), final=False)
+            meta["decoded_seconds"] = round(decoded / SAMPLE_RATE, 3)
+            _write_meta(cache_dir, meta)
+
+        tail = np.clip(np.round(carry_samples * 127), -127, 127).astype(np.int8)
+        push(
+            0,
+            tail.min(keepdims=True) if tail.size else tail,
+            tail.max(keepdims=True) if tail.size else tail,
+            final=True,
+        )
+        meta["complete"] = True
+    except Exception as e:
+        meta["error"] = str(e)
+    finally:
+        for f in files:
+            f.close()
+        try:
+            _write_meta(cache_dir, meta)
+        except OSError:
+            pass  # nothing more to record; ensure() retries the unfinished pyramid
+        with _generating_lock:
+            _generating.pop(cache_dir, None)
+
+
+def ensure(file_path: str) -> tuple[str, dict]:
+    """Start generating peaks for file_path if needed. Returns (cache_dir, meta)."""
+    cache_dir = _cache_dir(file_path)
+    with _generating_lock:
+        meta = _read_meta(cache_dir)
+        running = cache_dir in _generating
+        # An incomplete pyramid nobody is working on was interrupted: start over
+        if not running and (meta is None or (not meta.get("complete") and "error" not in meta)):
+            os.makedirs(cache_dir, exist_ok=True)
+            _write_meta(cache_dir, {"complete": False, "decoded_seconds": 0.0})
+            t = threading.Thread(target=_generate, args=(file_path, cache_dir), daemon=True)
+            _generating[cache_dir] = t
+            t.start()
+    return cache_dir, _read_meta(cache_dir) or {}
+
+
+def available_peaks(cache_dir: str, level: int) -> int:
+    try:
+        return os.path.getsize(_level_path(cache_dir, level)) // 2
+    except OSError:
+        return 0
+
+
+def choose_level(start: float, end: float, width: int) -> int:
+    """Coarsest level that still gives at least `width` peaks over [start, end)."""
+    wanted = max(1.0, (end - start) * SAMPLE_RATE / max(1, width))
+    level = 0
+    while level + 1 < LEVELS and samples_per_peak(level + 1) <= wanted:
+        level += 1
+    return level
+
+
+def iter_slice(cache_dir: str, level: int, first: int, count: int):
+    """
+    Yield the bytes of peaks [first, first + count) of a level as a memoryview
+    into an mmap of the level file, so the slice is never copied in Python.
+    """
+    if count <= 0:
+        return
+    with open(_level_path(cache_dir, level), "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        yield view[first * 2:(first + count) * 2]
+    finally:
+        view.release()
+        try:
+            mm.close()
+        except BufferError:
+            pass  # a slice is still referenced by the transport; GC closes it later
@@ -0,0 +1,249 @@
+"""
+Streaming decode → VAD → inference pipeline for long-file transcription.
+
+A decoder thread turns the file into PCM chunks (following the chunk plan built
+by main._do_full_transcription), a VAD thread finds the speech regions in each
+chunk, and the caller — the inference stage — iterates over the results. Bounded
+queues sit between the stages, so decoding of chunk N+1 overlaps inference of
+chunk N and memory is capped at roughly QUEUE_SIZE chunks per queue instead of
+the whole file.
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+
+import transcriber
+
+QUEUE_SIZE = 2            # chunks buffered between two stages
+DECODE_BLOCK = 30.0       # seconds of PCM produced per decoder step
+
+_END = object()
+
+
+class StageStats:
+    """Wall-clock accounting for one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0      # doing its own work
+        self.starved = 0.0   # waiting for the upstream stage
+        self.blocked = 0.0   # waiting for room in the downstream queue
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "starved_s": round(self.starved, 3),
+            "blocked_s": round(self.blocked, 3),
+        }
+
+
+class ChunkPipeline:
+    """
+    Iterate over the chunks of a file with decoding and VAD running ahead.
+
+    chunks is a list of (clip_start, clip_end, boundary_start, is_last) in
+    seconds. Each yielded item is a dict with those keys plus "index", "audio"
+    (float32 PCM of the clip) and "speech_chunks" (Silero VAD sample ranges
+    relative to the clip). Chunks that turn out to have no audio are dropped, and
+    is_last is moved to the final chunk that actually has audio.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        chunks: list[tuple[float, float, float, bool]],
+        sampling_rate: int = 16000,
+        vad_parameters=None,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.file_path = file_path
+        self.chunks = chunks
+        self.sampling_rate = sampling_rate
+        self.vad_parameters = vad_parameters
+        self._decoded: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._speech: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self.decode_stats = StageStats("decode")
+        self.vad_stats = StageStats("vad")
+        self.inference_stats = StageStats("inference")
+
+    # ── Queue helpers (stop-aware so abandoned pipelines never hang) ─────────
+
+    def _put(self, q: queue.Queue, item, stats: StageStats) -> bool:
+        t0 = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            stats.blocked += time.perf_counter() - t0
+
+    def _get(self, q: queue.Queue, stats: StageStats):
+        t0 = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _END
+        finally:
+            stats.starved += time.perf_counter() - t0
+
+    # ── Stages ───────────────────────────────────────────────────────────────
+
+    def _decode(self) -> None:
+        stats = self.decode_stats
+        sr = self.sampling_rate
+        blocks: list[np.ndarray] = []
+        buf_start = 0      # absolute sample index of blocks[0][0]
+        buf_len = 0
+        next_idx = 0
+        pending: dict | None = None
+
+        def emit(item: dict) -> bool:
+            nonlocal pending
+            # Hold one chunk back so is_last can be fixed up at end of file.
+            ready, pending = pending, item
+            if ready is None:
+                return True
+            stats.items += 1
+            return self._put(self._decoded, ready, stats)
+
+        def cut(end_sample: int | None) -> dict:
+            clip_start, clip_end, boundary_start, is_last = self.chunks[next_idx]
+            lo = max(0, int(clip_start * sr) - buf_start)
+            hi = buf_len if end_sample is None else min(buf_len, end_sample - buf_start)
+            joined = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+            return {
+                "index": next_idx,
+                "clip_start": clip_start,
+                "clip_end": clip_end,
+                "boundary_start": boundary_start,
+                "is_last": is_last,
+                "audio": joined[lo:hi].copy() if hi > lo else np.zeros(0, dtype=np.float32),
+            }
+
+        def trim() -> None:
+            nonlocal blocks, buf_start, buf_len
+            # Drop samples no later chunk needs.
+            if next_idx >= len(self.chunks):
+                blocks, buf_start, buf_len = [], buf_start + buf_len, 0
+                return
+            keep_from = int(self.chunks[next_idx][0] * sr)
+            while blocks and buf_start + blocks[0].size <= keep_from:
+                buf_start += blocks[0].size
+                buf_len -= blocks[0].size
+                blocks.pop(0)
+
+        try:
+            t0 = time.perf_counter()
+            for block in transcriber.iter_audio_blocks(self.file_path, sr, DECODE_BLOCK):
+                if self._stop.is_set():
+                    return
+                blocks.append(block)
+                buf_len += block.size
+                while next_idx < len(self.chunks):
+                    end_sample = int(self.chunks[next_idx][1] * sr)
+                    if buf_start + buf_len < end_sample:
+                        break
+                    item = cut(end_sample)
+                    next_idx += 1
+                    stats.busy += time.perf_counter() - t0
+                    if not emit(item):
+                        return
+                    t0 = time.perf_counter()
+                    trim()
+                trim()
+            stats.busy += time.perf_counter() - t0
+
+            # End of file: whatever remains goes to the chunks not yet cut.
+            while next_idx < len(self.chunks) and blocks:
+                item = cut(None)
+                next_idx += 1
+                if item["audio"].size == 0:
+                    break
+                if not emit(item):
+                    return
+                trim()
+            if pending is not None:
+                pending["is_last"] = True
+                stats.items += 1
+                if not self._put(self._decoded, pending, stats):
+                    return
+            self._put(self._decoded, _END, stats)
+        except Exception as e:
+            self._put(self._decoded, e, stats)
+
+    def _vad(self) -> None:
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+        stats = self.vad_stats
+        vad_parameters = self.vad_parameters
+        if vad_parameters is None:
+            vad_parameters = VadOptions()
+        elif isinstance(vad_parameters, dict):
+            vad_parameters = VadOptions(**vad_parameters)
+
+        while True:
+            item = self._get(self._decoded, stats)
+            if item is _END or isinstance(item, Exception):
+                self._put(self._speech, item, stats)
+                return
+            t0 = time.perf_counter()
+            try:
+                item["speech_chunks"] = (
+                    get_speech_timestamps(item["audio"], vad_parameters, sampling_rate=self.sampling_rate)
+                    if item["audio"].size else []
+                )
+            except Exception as e:
+                self._put(self._speech, e, stats)
+                return
+            stats.busy += time.perf_counter() - t0
+            stats.items += 1
+            if not self._put(self._speech, item, stats):
+                return
+
+    # ── Consumer side ────────────────────────────────────────────────────────
+
+    def __iter__(self):
+        self._threads = [
+            threading.Thread(target=self._decode, name="pipeline-decode", daemon=True),
+            threading.Thread(target=self._vad, name="pipeline-vad", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+        stats = self.inference_stats
+        try:
+            while True:
+                item = self._get(self._speech, stats)
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                stats.items += 1
+                t0 = time.perf_counter()
+                yield item
+                stats.busy += time.perf_counter() - t0
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop the background stages (safe to call more than once)."""
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            s.name: s.as_dict()
+            for s in (self.decode_stats, self.vad_stats, self.inference_stats)
+        }
@@ -0,0 +1,189 @@
+"""
+Cross-session micro-batching for /ws/realtime.
+
+Every websocket session submits its utterances here instead of grabbing the
+model lock itself. A single worker task collects pending utterances from all
+sessions and runs them through the model together, then routes each result
+back to the session that sent it.
+
+The collection window adapts to load:
+  • with one active session (or sparse arrivals) the window is 0, so a single
+    user sees the same latency as before;
+  • with several sessions it waits up to MAX_WINDOW — roughly the time the
+    next few arrivals are expected to take — or until MAX_BATCH is reached;
+  • utterances that queue up while the model is busy are always taken in one go.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+MAX_BATCH = 8              # utterances per model call
+MAX_WINDOW = 0.04          # seconds to wait for more utterances under load
+MAX_PENDING = 64           # beyond this, new utterances are rejected as busy
+_EWMA = 0.2                # smoothing for arrival-gap and batch statistics
+
+
+class Busy(Exception):
+    """The model is held by another job, or the queue is full."""
+
+
+class _Pending:
+    __slots__ = ("key", "model", "language", "audio", "future", "arrived")
+
+    def __init__(self, model, language, audio: bytes, future: asyncio.Future):
+        self.key = (id(model), language)
+        self.model = model
+        self.language = language
+        self.audio = audio
+        self.future = future
+        self.arrived = time.perf_counter()
+
+
+class RealtimeBatcher:
+    """
+    run_batch(model, language, [audio_bytes, …]) runs in a worker thread and
+    must return one entry per utterance: a list of result dicts, or an Exception.
+    """
+
+    def __init__(
+        self,
+        run_batch,
+        model_lock: threading.Lock,
+        max_batch: int = MAX_BATCH,
+        max_window: float = MAX_WINDOW,
+        max_pending: int = MAX_PENDING,
+    ):
+        self._run_batch = run_batch
+        self._lock = model_lock
+        self.max_batch = max_batch
+        self.max_window = max_window
+        self.max_pending = max_pending
+        self._queue: deque[_Pending] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._sessions = 0
+        self._last_arrival: float | None = None
+        self._gap = max_window * 2     # EWMA of time between arrivals (all sessions)
+        self._batches = 0
+        self._utterances = 0
+        self._mean_batch = 1.0
+        self._mean_batch_s = 0.0
+
+    # ── Sessions ─────────────────────────────────────────────────────────────
+
+    def open_session(self) -> None:
+        self._sessions += 1
+
+    def close_session(self) -> None:
+        self._sessions = max(0, self._sessions - 1)
+
+    # ── Submission ───────────────────────────────────────────────────────────
+
+    async def submit(self, model, language: str | None, audio: bytes) -> list[dict]:
+        if len(self._queue) >= self.max_pending:
+            raise Busy()
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._work())
+
+        now = time.perf_counter()
+        if self._last_arrival is not None:
+            self._gap += _EWMA * ((now - self._last_arrival) - self._gap)
+        self._last_arrival = now
+
+        pending = _Pending(model, language, audio, loop.create_future())
+        self._queue.append(pending)
+        self._wakeup.set()
+        return await pending.future
+
+    def _window(self) -> float:
+        if self._sessions <= 1 or self._gap > self.max_window:
+            return 0.0
+        expected = min(self._sessions, self.max_batch) - 1
+        return min(self.max_window, self._gap * expected)
+
+    def _take_batch(self) -> list[_Pending]:
+        """Up to max_batch queued utterances sharing the first one's model and language."""
+        key = self._queue[0].key
+        batch: list[_Pending] = []
+        rest: deque[_Pending] = deque()
+        while self._queue:
+            p = self._queue.popleft()
+            if p.future.done():
+                continue  # session went away
+            if p.key == key and len(batch) < self.max_batch:
+                batch.append(p)
+            else:
+                rest.append(p)
+        self._queue = rest
+        return batch
+
+    # ── Worker ───────────────────────────────────────────────────────────────
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            window = self._window()
+            if window > 0:
+                deadline = self._queue[0].arrived + window
+                while len(self._queue) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+
+            batch = self._take_batch()
+            if not batch:
+                continue
+
+            if not self._lock.acquire(blocking=False):
+                for p in batch:
+                    if not p.future.done():
+                        p.future.set_exception(Busy())
+                continue
+
+            t0 = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(
+                    None, self._run_batch, batch[0].model, batch[0].language, [p.audio for p in batch],
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+            finally:
+                self._lock.release()
+
+            self._batches += 1
+            self._utterances += len(batch)
+            self._mean_batch += _EWMA * (len(batch) - self._mean_batch)
+            self._mean_batch_s += _EWMA * ((time.perf_counter() - t0) - self._mean_batch_s)
+
+            for p, result in zip(batch, results):
+                if p.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    p.future.set_exception(result)
+                else:
+                    p.future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self._sessions,
+            "queued": len(self._queue),
+            "batches": self._batches,
+            "utterances": self._utterances,
+            "mean_batch_size": round(self._mean_batch, 2),
+            "mean_batch_seconds": round(self._mean_batch_s, 4),
+            "arrival_gap_seconds": round(self._gap, 4),
+            "window_seconds": round(self._window(), 4),
+        }
@@ -1,5 +1,6 @@
 import os
 import ctypes
+import json
 import subprocess
 
 # On Windows with Python 3.8+, DLLs are only loaded from os.add_dll_directory
@@ -25,6 +26,14 @@ def _safe_print(*args, **kwargs):
 
 _model: WhisperModel | None = None
 _model_name: str | None = None
+# (device, compute_type, cpu_threads, num_workers) the current model was built with
+_model_config: tuple | None = None
+# load_model() arguments that produced the current model, so repeat calls skip tuning.json
+_model_request: tuple | None = None
+# Bumped by save_tuned_config() so the next load_model() re-reads the tuning
+_tuning_generation = 0
+_device: str | None = None
+_machine_id: str | None = None
 # None = not yet tested  |  True = CUDA works  |  False = CUDA unusable
 _cuda_usable: bool | None = None
 
@@ -74,31 +83,125 @@ def get_cuda_info() -> dict:
     return {"cuda_available": cuda_available, "gpu_name": gpu_name}
 
 
-def load_model(model_name: str) -> WhisperModel:
-    global _model, _model_name
+def get_data_dir() -> str:
+    """Directory for backend state that should survive restarts (tuning, caches…)."""
+    path = os.environ.get(
+        "WHISPER_APP_DATA_DIR", os.path.join(os.path.expanduser("~"), ".cache", "whisper-app")
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
 
-    if _model is not None and _model_name == model_name:
+
+def get_device() -> str:
+    """Cached; get_cuda_info() runs nvidia-smi. disable_cuda() clears it."""
+    global _device
+    if _device is None:
+        _device = "cuda" if get_cuda_info()["cuda_available"] else "cpu"
+    return _device
+
+
+def get_machine_id() -> str:
+    """Stable identifier for this machine's hardware, used to key tuned configs."""
+    global _machine_id
+    if _machine_id is None:
+        import hashlib
+        import platform
+        parts = [
+            platform.node(), platform.machine(), platform.processor(),
+            str(os.cpu_count()), str(get_cuda_info()["gpu_name"]),
+        ]
+        _machine_id = hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+    return _machine_id
+
+
+def _tuning_path() -> str:
+    return os.path.join(get_data_dir(), "tuning.json")
+
+
+def _read_tuning() -> dict:
+    try:
+        with open(_tuning_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_tuned_config(model_name: str, device: str | None = None) -> dict | None:
+    """Return the calibrated {compute_type, cpu_threads, num_workers, ...} for this machine, if any."""
+    device = device or get_device()
+    return _read_tuning().get(get_machine_id(), {}).get(f"{model_name}@{device}")
+
+
+def save_tuned_config(model_name: str, device: str, config: dict) -> None:
+    global _tuning_generation
+    data = _read_tuning()
+    data.setdefault(get_machine_id(), {})[f"{model_name}@{device}"] = config
+    tmp = _tuning_path() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, _tuning_path())
+    _tuning_generation += 1
+
+
+def load_model(
+    model_name: str,
+    compute_type: str | None = None,
+    cpu_threads: int | None = None,
+    num_workers: int | None = None,
+) -> WhisperModel:
+    """
+    Load (or reuse) the model. Explicit arguments win, then the calibrated config
+    saved by tuning.py for this machine, then the built-in defaults
+    (float16 on CUDA, int8 on CPU, CTranslate2's own thread count).
+
+    Repeat calls with the same arguments return the cached model without
+    touching tuning.json; a calibration saved by another process (tuning.py
+    CLI) is picked up on the next restart.
+    """
+    global _model, _model_name, _model_config, _model_request
+
+    device = get_device()
+    request = (model_name, device, compute_type, cpu_threads, num_workers, _tuning_generation)
+    if _model is not None and _model_request == request:
         return _model
 
-    cuda_info = get_cuda_info()
+    tuned = get_tuned_config(model_name, device) or {}
+    config = (
+        device,
+        compute_type or tuned.get("compute_type") or ("float16" if device == "cuda" else "int8"),
+        cpu_threads if cpu_threads is not None else tuned.get("cpu_threads", 0),
+        num_workers if num_workers is not None else tuned.get("num_workers", 1),
+    )
 
-    if cuda_info["cuda_available"]:
-        _safe_print(f"[transcriber] Loading '{model_name}' on CUDA (float16)...", flush=True)
-        _model = WhisperModel(model_name, device="cuda", compute_type="float16")
-    else:
-        _safe_print(f"[transcriber] Loading '{model_name}' on CPU (int8)...", flush=True)
-        _model = WhisperModel(model_name, device="cpu", compute_type="int8")
+    if _model is not None and _model_name == model_name and _model_config == config:
+        _model_request = request
+        return _model
+
+    _safe_print(
+        f"[transcriber] Loading '{model_name}' on {device.upper()} ({config[1]}, "
+        f"cpu_threads={config[2]}, num_workers={config[3]})...",
+        flush=True,
+    )
+    _model = WhisperModel(
+        model_name, device=device, compute_type=config[1],
+        cpu_threads=config[2], num_workers=config[3],
+    )
 
     _model_name = model_name
+    _model_config = config
+    _model_request = request
     return _model
 
 
 def disable_cuda() -> None:
     """Call this when a CUDA error occurs during inference to force future loads to CPU."""
-    global _model, _model_name, _cuda_usable
+    global _model, _model_name, _model_config, _model_request, _cuda_usable, _device
     _cuda_usable = False
+    _device = None
     _model = None
     _model_name = None
+    _model_config = None
+    _model_request = None
 
 
 def get_loaded_model_name() -> str | None:
@@ -106,9 +209,11 @@ def get_loaded_model_name() -> str | None:
 
 
 def unload_model() -> None:
-    global _model, _model_name
+    global _model, _model_name, _model_config, _model_request
     _model = None
     _model_name = None
+    _model_config = None
+    _model_request = None
 
 
 def is_model_downloaded(model_name: str) -> bool:
@@ -157,3 +262,103 @@ def get_audio_duration(file_path: str) -> float:
         return 0.0
     except Exception:
         return 0.0
+
+
+def iter_audio_blocks(file_path: str, sampling_rate: int = 16000, block_seconds: float = 30.0):
+    """
+    Decode a file with PyAV and yield mono float32 PCM blocks of roughly block_seconds.
+    Unlike faster_whisper.decode_audio, the whole file is never held in memory at once.
+    """
+    import av
+    import numpy as np
+
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    block_samples = int(block_seconds * sampling_rate)
+    pending: list = []
+    pending_len = 0
+
+    def flush():
+        nonlocal pending, pending_len
+        block = np.concatenate(pending).astype(np.float32) / 32768.0
+        pending, pending_len = [], 0
+        return block
+
+    with av.open(file_path, mode="r", metadata_errors="ignore") as container:
+        for frame in container.decode(audio=0):
+            try:
+                resampled = resampler.resample(frame)
+            except av.error.InvalidDataError:
+                continue
+            for out in resampled:
+                array = out.to_ndarray().reshape(-1)
+                pending.append(array)
+                pending_len += array.size
+            if pending_len >= block_samples:
+                yield flush()
+        for out in resampler.resample(None):
+            array = out.to_ndarray().reshape(-1)
+            pending.append(array)
+            pending_len += array.size
+
+    if pending_len:
+        yield flush()
+
+
+def decode_audio_range(file_path: str, start: float, end: float | None = None, sampling_rate: int = 16000):
+    """
+    Decode only [start, end) seconds of a file: seek with PyAV to the keyframe
+    before `start` and stop once frames pass `end`.
+
+    Times are on the decode-from-zero timeline used by decode_audio and
+    iter_audio_blocks: the stream's start_time (≈1.4 s in MPEG-TS, for
+    instance) is added to the seek target and subtracted from frame times.
+
+    Returns (audio, offset): mono float32 PCM and the absolute time in seconds of
+    audio[0], which is `start` unless the file ends or begins inside the range.
+    """
+    import av
+    import numpy as np
+
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    pieces: list = []
+    first_time: float | None = None
+    end = float("inf") if end is None else end
+
+    with av.open(file_path, mode="r", metadata_errors="ignore") as container:
+        stream = container.streams.audio[0]
+        origin = 0.0
+        if stream.start_time is not None and stream.time_base is not None:
+            origin = float(stream.start_time * stream.time_base)
+        if start > 0:
+            try:
+                # Without a stream argument the offset is in av.time_base (µs)
+                container.seek(int((start + origin) * av.time_base), backward=True, any_frame=False)
+            except av.error.FFmpegError:
+                pass  # not seekable: decode from the top and skip
+        for frame in container.decode(stream):
+            time_base = frame.time_base or stream.time_base
+            if frame.pts is None or time_base is None:
+                frame_start = None
+            else:
+                frame_start = float(frame.pts * time_base) - origin
+                if frame_start >= end:
+                    break
+                if frame_start + frame.samples / frame.sample_rate < start:
+                    continue
+            try:
+                resampled = resampler.resample(frame)
+            except av.error.InvalidDataError:
+                continue
+            if first_time is None:
+                first_time = frame_start if frame_start is not None else 0.0
+            for out in resampled:
+                pieces.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            pieces.append(out.to_ndarray().reshape(-1))
+
+    if not pieces or first_time is None:
+        return np.zeros(0, dtype=np.float32), start
+    audio = np.concatenate(pieces).astype(np.float32) / 32768.0
+    lo = max(0, int(round((start - first_time) * sampling_rate)))
+    hi = audio.size if end == float("inf") else max(lo, int(round((end - first_time) * sampling_rate)))
+    return audio[lo:hi], first_time + lo / sampling_rate
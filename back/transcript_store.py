@@ -0,0 +1,303 @@
+"""
+SQLite-backed transcript store with an FTS5 full-text index over segment text.
+
+Lets the app page through one transcript or search across all of them without
+loading every transcript into memory. Segments from a full-file /transcribe job
+are written here as they are produced when the request names a transcript_id.
+
+The index uses FTS5's trigram tokenizer, so search matches substrings and works
+for Japanese and Chinese (no spaces between words) as well as Korean particles.
+Terms shorter than three characters can't use a trigram index and are matched
+with LIKE instead.
+"""
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id              TEXT PRIMARY KEY,
+    project_id      TEXT,
+    target_language TEXT,
+    updated_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_project ON transcripts(project_id);
+
+CREATE TABLE IF NOT EXISTS segments (
+    rowid           INTEGER PRIMARY KEY,
+    transcript_id   TEXT NOT NULL REFERENCES transcripts(id) ON DELETE CASCADE,
+    seq             INTEGER NOT NULL,
+    segment_id      TEXT NOT NULL,
+    start_ms        INTEGER NOT NULL,
+    end_ms          INTEGER NOT NULL,
+    text            TEXT NOT NULL,
+    translated_text TEXT,
+    UNIQUE (transcript_id, seq)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, translated_text,
+    content='segments', content_rowid='rowid',
+    tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts(rowid, text, translated_text)
+    VALUES (new.rowid, new.text, coalesce(new.translated_text, ''));
+END;
+CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts(segments_fts, rowid, text, translated_text)
+    VALUES ('delete', old.rowid, old.text, coalesce(old.translated_text, ''));
+END;
+CREATE TRIGGER IF NOT EXISTS segments_au AFTER UPDATE ON segments BEGIN
+    INSERT INTO segments_fts(segments_fts, rowid, text, translated_text)
+    VALUES ('delete', old.rowid, old.text, coalesce(old.translated_text, ''));
+    INSERT INTO segments_fts(rowid, text, translated_text)
+    VALUES (new.rowid, new.text, coalesce(new.translated_text, ''));
+END;
+"""
+
+SCHEMA_VERSION = 2          # 1: unicode61 tokenizer, 2: trigram
+
+WRITER_BATCH = 50          # segments per transaction while a job is running
+WRITER_INTERVAL = 1.0      # …or at least this often (seconds)
+
+
+def _search_terms(q: str) -> tuple[str, list[str]]:
+    """
+    Split free text into a safe FTS5 query — every term of 3+ characters quoted,
+    which the trigram index matches as a substring — and the shorter terms.
+    """
+    terms = q.split()
+    match = " ".join('"' + t.replace('"', '""') + '"' for t in terms if len(t) >= 3)
+    return match, [t for t in terms if len(t) < 3]
+
+
+def _like(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _highlight(text: str, terms: list[str]) -> str:
+    """Bracket the first match of each term, like snippet() does for FTS matches."""
+    for term in terms:
+        i = text.lower().find(term.lower())
+        if i >= 0:
+            text = f"{text[:i]}[{text[i:i + len(term)]}]{text[i + len(term):]}"
+    return text
+
+
+class TranscriptStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # Older stores were indexed with unicode61; re-index with trigrams
+                conn.execute("DROP TABLE IF EXISTS segments_fts")
+            conn.executescript(SCHEMA)
+            if version < SCHEMA_VERSION:
+                conn.execute("INSERT INTO segments_fts(segments_fts) VALUES ('rebuild')")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.commit()
+            self._conn = conn
+        return self._conn
+
+    # ── Writes ───────────────────────────────────────────────────────────────
+
+    def _upsert_transcript(self, db, transcript_id: str, project_id: str | None, target_language: str | None = None):
+        db.execute(
+            """
+            INSERT INTO transcripts (id, project_id, target_language, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                project_id = coalesce(excluded.project_id, project_id),
+                target_language = coalesce(excluded.target_language, target_language),
+                updated_at = excluded.updated_at
+            """,
+            (transcript_id, project_id, target_language, time.time()),
+        )
+
+    def replace(
+        self,
+        transcript_id: str,
+        project_id: str | None,
+        segments: list[dict],
+        target_language: str | None = None,
+    ) -> None:
+        """Replace all segments of a transcript (dicts with id/start_ms/end_ms/text/translated_text)."""
+        with self._lock, self._db() as db:
+            self._upsert_transcript(db, transcript_id, project_id, target_language)
+            db.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+            self._insert(db, transcript_id, 0, segments)
+
+    def append(self, transcript_id: str, project_id: str | None, first_seq: int, segments: list[dict]) -> None:
+        with self._lock, self._db() as db:
+            self._upsert_transcript(db, transcript_id, project_id)
+            self._insert(db, transcript_id, first_seq, segments)
+
+    def _insert(self, db, transcript_id: str, first_seq: int, segments: list[dict]) -> None:
+        db.executemany(
+            """
+            INSERT INTO segments (transcript_id, seq, segment_id, start_ms, end_ms, text, translated_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    transcript_id, first_seq + i, str(s["id"]), int(s["start_ms"]), int(s["end_ms"]),
+                    s["text"], s.get("translated_text"),
+                )
+                for i, s in enumerate(segments)
+            ],
+        )
+
+    def clear(self, transcript_id: str, project_id: str | None) -> None:
+        with self._lock, self._db() as db:
+            self._upsert_transcript(db, transcript_id, project_id)
+            db.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+
+    def delete(self, transcript_id: str) -> bool:
+        with self._lock, self._db() as db:
+            db.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+            return db.execute("DELETE FROM transcripts WHERE id = ?", (transcript_id,)).rowcount > 0
+
+    # ── Reads ────────────────────────────────────────────────────────────────
+
+    def get_segments(self, transcript_id: str, offset: int = 0, limit: int = 200) -> dict | None:
+        with self._lock:
+            db = self._db()
+            meta = db.execute(
+                "SELECT project_id, target_language FROM transcripts WHERE id = ?", (transcript_id,)
+            ).fetchone()
+            if meta is None:
+                return None
+            total = db.execute(
+                "SELECT count(*) FROM segments WHERE transcript_id = ?", (transcript_id,)
+            ).fetchone()[0]
+            rows = db.execute(
+                """
+                SELECT segment_id, start_ms, end_ms, text, translated_text FROM segments
+                WHERE transcript_id = ? ORDER BY seq LIMIT ? OFFSET ?
+                """,
+                (transcript_id, limit, offset),
+            ).fetchall()
+        return {
+            "transcript_id": transcript_id,
+            "project_id": meta["project_id"],
+            "target_language": meta["target_language"],
+            "total": total,
+            "offset": offset,
+            "segments": [
+                {
+                    "id": r["segment_id"],
+                    "start_ms": r["start_ms"],
+                    "end_ms": r["end_ms"],
+                    "text": r["text"],
+                    "translated_text": r["translated_text"],
+                }
+                for r in rows
+            ],
+        }
+
+    def search(self, q: str, project_id: str | None = None, limit: int = 50, offset: int = 0) -> list[dict]:
+        """
+        Ranked (bm25) matches across all transcripts, each with its timestamps.
+        A query made only of 1–2 character terms has no index to rank with and
+        is returned in transcript order.
+        """
+        match, short = _search_terms(q)
+        if not match and not short:
+            return []
+        if match:
+            sql = """
+                SELECT s.transcript_id, t.project_id, s.segment_id, s.start_ms, s.end_ms, s.text,
+                       snippet(segments_fts, -1, '[', ']', '…', 12) AS snippet,
+                       bm25(segments_fts) AS score
+                FROM segments_fts
+                JOIN segments s ON s.rowid = segments_fts.rowid
+                JOIN transcripts t ON t.id = s.transcript_id
+                WHERE segments_fts MATCH ?
+            """
+            params: list = [match]
+        else:
+            sql = """
+                SELECT s.transcript_id, t.project_id, s.segment_id, s.start_ms, s.end_ms, s.text,
+                       NULL AS snippet, 0.0 AS score
+                FROM segments s
+                JOIN transcripts t ON t.id = s.transcript_id
+                WHERE 1
+            """
+            params = []
+        for term in short:
+            sql += " AND (s.text LIKE ? ESCAPE '\\' OR coalesce(s.translated_text, '') LIKE ? ESCAPE '\\')"
+            params += [_like(term), _like(term)]
+        if project_id is not None:
+            sql += " AND t.project_id = ?"
+            params.append(project_id)
+        sql += " ORDER BY score LIMIT ? OFFSET ?" if match else " ORDER BY s.transcript_id, s.seq LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+        return [
+            {
+                "transcript_id": r["transcript_id"],
+                "project_id": r["project_id"],
+                "segment_id": r["segment_id"],
+                "start_ms": r["start_ms"],
+                "end_ms": r["end_ms"],
+                "text": r["text"],
+                "snippet": r["snippet"] if r["snippet"] is not None else _highlight(r["text"], short),
+                "score": round(-r["score"], 4) or 0.0,
+            }
+            for r in rows
+        ]
+
+
+class SegmentWriter:
+    """
+    Job event hook that persists "segment" events in small batches.
+
+    A segment with id "0" means the job (re)started — e.g. after a CUDA → CPU
+    retry — so the transcript's existing segments are cleared first.
+    """
+
+    def __init__(self, store: TranscriptStore, transcript_id: str, project_id: str | None):
+        self.store = store
+        self.transcript_id = transcript_id
+        self.project_id = project_id
+        self._pending: list[dict] = []
+        self._next_seq = 0
+        self._last_flush = time.time()
+
+    def __call__(self, event: dict) -> None:
+        kind = event.get("type")
+        if kind == "segment":
+            if event["id"] == "0":
+                self._pending.clear()
+                self._next_seq = 0
+                self.store.clear(self.transcript_id, self.project_id)
+            self._pending.append({
+                "id": event["id"],
+                "start_ms": round(event["start"] * 1000),
+                "end_ms": round(event["end"] * 1000),
+                "text": event["text"],
+            })
+            if len(self._pending) >= WRITER_BATCH or time.time() - self._last_flush > WRITER_INTERVAL:
+                self.flush()
+        elif kind in ("done", "error"):
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.time()
+        if not self._pending:
+            return
+        self.store.append(self.transcript_id, self.project_id, self._next_seq, self._pending)
+        self._next_seq += len(self._pending)
+        self._pending = []
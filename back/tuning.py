@@ -0,0 +1,143 @@
+"""
+Hardware calibration for WhisperModel compute type and threading.
+
+Benchmarks every supported compute type against a few cpu_threads counts on a
+short sample, and saves the fastest combination for this machine and model with
+transcriber.save_tuned_config(). transcriber.load_model() picks it up
+automatically from then on.
+
+Configurations are scored on a single transcribe() call, because that is what
+a file job is. num_workers only helps concurrent calls, so it is saved as 1
+rather than taking cores away from that call.
+
+Usable from the backend (POST /models/{model_name}/calibrate) or directly:
+
+    python tuning.py --model base --sample some_speech.wav
+"""
+import argparse
+import json
+import os
+import time
+
+import ctranslate2
+import numpy as np
+
+import transcriber
+
+CANDIDATE_COMPUTE_TYPES = ("int8", "int8_float32", "float32", "int8_float16", "float16")
+SAMPLE_SECONDS = 30.0
+SAMPLING_RATE = 16000
+
+# Same beam search as real jobs, but no VAD and no fallback so every run does the same work
+_BENCH_KWARGS: dict = {
+    'beam_size': 5,
+    'vad_filter': False,
+    'condition_on_previous_text': False,
+    'temperature': 0.0,
+}
+
+
+def _cpu_thread_counts(device: str) -> list[int]:
+    """cpu_threads values to try. All cores vs. half of them (SMT siblings often don't help)."""
+    if device == "cuda":
+        return [0]
+    cores = os.cpu_count() or 1
+    return sorted({cores, max(1, cores // 2)}, reverse=True)
+
+
+def _load_sample(sample_path: str | None, seconds: float) -> np.ndarray:
+    if sample_path:
+        from faster_whisper import decode_audio
+        audio = decode_audio(sample_path, sampling_rate=SAMPLING_RATE)
+        return audio[: int(seconds * SAMPLING_RATE)]
+    # No sample given: deterministic amplitude-modulated noise. The encoder cost is
+    # the same as for speech, but decoding is shorter, so prefer a real recording.
+    rng = np.random.default_rng(0)
+    n = int(seconds * SAMPLING_RATE)
+    envelope = 0.5 + 0.5 * np.sin(np.linspace(0, seconds * np.pi, n))
+    return (rng.standard_normal(n) * 0.05 * envelope).astype(np.float32)
+
+
+def benchmark(
+    model_name: str,
+    device: str,
+    compute_type: str,
+    cpu_threads: int,
+    audio: np.ndarray,
+) -> float:
+    """Return single-stream throughput in audio seconds per wall-clock second."""
+    from faster_whisper import WhisperModel
+
+    model = WhisperModel(
+        model_name, device=device, compute_type=compute_type,
+        cpu_threads=cpu_threads, num_workers=1,
+    )
+    # Warm-up so one-off allocation doesn't count
+    list(model.transcribe(audio[: SAMPLING_RATE * 5], **_BENCH_KWARGS)[0])
+
+    t0 = time.perf_counter()
+    list(model.transcribe(audio, **_BENCH_KWARGS)[0])
+    return (audio.size / SAMPLING_RATE) / (time.perf_counter() - t0)
+
+
+def calibrate(
+    model_name: str,
+    sample_path: str | None = None,
+    seconds: float = SAMPLE_SECONDS,
+    save: bool = True,
+    log=transcriber._safe_print,
+) -> dict:
+    """
+    Benchmark all candidates and return {"device", "best", "results"}.
+    The best configuration is persisted unless save=False.
+    """
+    device = transcriber.get_device()
+    supported = ctranslate2.get_supported_compute_types(device)
+    audio = _load_sample(sample_path, seconds)
+
+    results: list[dict] = []
+    for compute_type in CANDIDATE_COMPUTE_TYPES:
+        if compute_type not in supported:
+            continue
+        for cpu_threads in _cpu_thread_counts(device):
+            entry: dict = {
+                "compute_type": compute_type,
+                "cpu_threads": cpu_threads,
+                "num_workers": 1,
+            }
+            try:
+                entry["audio_seconds_per_second"] = round(
+                    benchmark(model_name, device, compute_type, cpu_threads, audio), 3
+                )
+            except Exception as e:
+                entry["error"] = str(e)
+            log(f"[tuning] {model_name}@{device} {json.dumps(entry)}", flush=True)
+            results.append(entry)
+
+    ok = [r for r in results if "error" not in r]
+    if not ok:
+        raise RuntimeError("No compute type could be benchmarked on this machine")
+    best = {
+        **max(ok, key=lambda r: r["audio_seconds_per_second"]),
+        "sample_seconds": round(audio.size / SAMPLING_RATE, 1),
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if save:
+        transcriber.save_tuned_config(model_name, device, best)
+    return {"device": device, "best": best, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate faster-whisper settings for this machine.")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--sample", help="audio/video file to benchmark on (default: synthetic noise)")
+    parser.add_argument("--seconds", type=float, default=SAMPLE_SECONDS)
+    parser.add_argument("--dry-run", action="store_true", help="don't save the result")
+    args = parser.parse_args()
+
+    report = calibrate(args.model, args.sample, args.seconds, save=not args.dry_run)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()